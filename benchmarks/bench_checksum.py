@@ -0,0 +1,71 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Compare the checksum module with the former byte-by-byte implementation of
+# tools.calculate_checksum: first the results are checked on random buffers,
+# then both implementations are timed
+#
+
+import sys
+import random
+import timeit
+import bench_util
+import checksum
+
+CASES = 100000
+
+
+# former implementation of tools.calculate_checksum
+def reference_checksum(bytestring):
+    cs = 0
+    for b in bytestring:
+        cs = (cs + b) % 0xFF
+
+    cs = ~cs & 0xFF
+    if cs == 0xFF:
+        cs = 0
+    return cs
+
+
+def random_buffer(rnd):
+    n = rnd.choice((0, 1, 2, 8, 9, 30, 36, 300))
+    # zero and 0xff filled buffers are the interesting corner cases of the carry
+    fill = rnd.random()
+    if fill < 0.1:
+        return bytes(n)
+    if fill < 0.2:
+        return bytes([0xFF]) * n
+    return bytes(rnd.getrandbits(8) for _ in range(n))
+
+
+def check(rnd):
+    for _ in range(CASES):
+        buf = random_buffer(rnd)
+        pid = rnd.getrandbits(8)
+        ref = reference_checksum(buf)
+        if checksum.classic(buf) != ref \
+                or checksum.classic(memoryview(b"\x00" + buf)[1:]) != ref \
+                or checksum.enhanced(pid, buf) != reference_checksum(bytes([pid]) + buf):
+            print(f"checksum mismatch: pid {pid:02x} buffer {buf.hex(' ')}")
+            return False
+    return True
+
+
+def main():
+    if not check(random.Random(0)):
+        return 1
+    print(f"{CASES} random buffers: results identical")
+    frame = bytes.fromhex("03 22 54 01 0c 32 02 22")
+    status = bytes(30)
+    for name, buf in (("frame (8 bytes)", frame), ("status buffer (30 bytes)", status)):
+        n = 200000
+        t_ref = timeit.timeit(lambda: reference_checksum(buf), number=n) / n
+        t_new = timeit.timeit(lambda: checksum.classic(buf), number=n) / n
+        bench_util.report(f"{name}: byte loop", t_ref * 1e6, "us")
+        bench_util.report(f"{name}: checksum.classic", t_new * 1e6, "us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Latency of set commands from MQTT to the LIN bus while the status publisher is running: the
+# time until main.callback has applied the command, and the time until the inetbox answers a
+# 0x18 poll of the simulated CPplus with the update request.
+# The publisher runs with the committed status snapshot of main.main and with the former loop,
+# which held the lock for 2 s of every 10 s cycle. The cycle is scaled down to 1 s (0.2 s lock).
+#
+
+import sys
+import time
+import random
+import asyncio
+import bench_util
+import main
+from lin import RESP_D8_UPDATE
+
+DURATION = 8 # seconds per publisher
+D8_PERIOD = 0.020 # seconds between the 0x18 polls of the simulated CPplus
+PUBLISH_INTERVAL = 1.0
+TOPIC = (main.SET_PREFIX + "target_temp_room").encode()
+
+
+class Client:
+    async def publish_many(self, msgs, retain=False, qos=0):
+        pass
+
+
+class Connect:
+    client = Client()
+
+
+# main.main and main.callback before the status snapshot, scaled down
+lock = None
+
+async def former_main():
+    while True:
+        await asyncio.sleep(PUBLISH_INTERVAL * 0.8)
+        async with lock:
+            await asyncio.sleep(PUBLISH_INTERVAL * 0.2)
+            s = main.lin.app.get_all(True)
+        await main.connect.client.publish_many([(main.STA_PREFIX + key, str(s[key])) for key in s], qos=1)
+
+
+async def former_callback(topic, msg, retained, qos):
+    async with lock:
+        await main.callback(topic, msg, retained, qos)
+
+
+async def measure(name, publisher, callback):
+    global lock
+    serial = bench_util.MemorySerial()
+    main.lin = bench_util.make_lin(serial)
+    lock = asyncio.Lock()
+    main.connect = Connect()
+    app = main.lin.app
+    pub = asyncio.create_task(publisher())
+    rnd = random.Random(0)
+    applied = []
+    on_bus = []
+    t_end = time.monotonic() + DURATION
+    value = 20
+    while time.monotonic() < t_end:
+        await asyncio.sleep(rnd.uniform(0.05, 0.25))
+        value = 41 - value # 20, 21, 20, ...
+        t0 = time.monotonic()
+        await callback(TOPIC, str(value).encode(), False, 0)
+        applied.append(time.monotonic() - t0)
+        # 0x18 polls until the inetbox requests the update
+        while True:
+            serial.tx.clear()
+            serial.feed(bytes.fromhex("00 55 d8"))
+            await main.lin.loop_serial()
+            if serial.tx and serial.tx[0] == RESP_D8_UPDATE:
+                on_bus.append(time.monotonic() - t0)
+                app.upload_buffer = 0 # the transfer itself is not simulated
+                break
+            await asyncio.sleep(D8_PERIOD)
+    pub.cancel()
+    for label, values in (("command applied", applied), ("update request on bus", on_bus)):
+        bench_util.report(f"{name}: {label}, mean", sum(values) / len(values) * 1000, "ms")
+        bench_util.report(f"{name}: {label}, max", max(values) * 1000, "ms")
+    return max(on_bus)
+
+
+async def run():
+    bench_util.mute_debug_log()
+    await measure("former lock", former_main, former_callback)
+    worst = await measure("status snapshot", main.main, main.callback)
+    return 0 if worst < 0.100 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,38 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Microbenchmark for the 0x18 poll (raw PID 0xD8): time from the received PID
+# to the written reply, measured with an in-memory serial port
+#
+
+import time
+import asyncio
+import bench_util
+
+ROUNDS = 20000
+D8_POLL = bytes.fromhex("00 55 d8")
+
+
+async def run():
+    written = []
+    serial = bench_util.MemorySerial(on_write=lambda data: written.append(time.perf_counter_ns()))
+    lin = bench_util.make_lin(serial)
+    latency = []
+    for _ in range(ROUNDS):
+        serial.feed(D8_POLL)
+        t0 = time.perf_counter_ns()
+        await lin.loop_serial()
+        latency.append(written[-1] - t0)
+    return latency
+
+
+def main():
+    latency = sorted(asyncio.run(run()))
+    bench_util.report("0xD8 reply latency (median)", latency[len(latency) // 2] / 1000, "us")
+    bench_util.report("0xD8 reply latency (99%)", latency[len(latency) * 99 // 100] / 1000, "us")
+    bench_util.report("0xD8 reply latency (max)", latency[-1] / 1000, "us")
+
+
+if __name__ == "__main__":
+    main()
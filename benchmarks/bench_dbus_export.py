@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# D-Bus export of the Truma status with a mocked VeDbusService, which counts the value writes
+# (each one is a PropertiesChanged signal on the real bus). The GLib main loop thread is stood
+# in for by a thread working off a queue of idle callbacks.
+# Reported are the delay from DbusExport.update() in the asyncio loop until the values are set
+# in the D-Bus thread, and the D-Bus writes per status change with and without the check for
+# unchanged values.
+#
+
+import sys
+import time
+import queue
+import random
+import asyncio
+import threading
+import bench_util
+from dbus_export import DbusExport
+
+ROUNDS = 500
+
+
+class MockService:
+
+    writes = 0
+
+    def __init__(self, name, bus):
+        self.name = name
+        self.values = {}
+
+    def add_path(self, path, value, writeable=False, onchangecallback=None):
+        self.values[path] = value
+
+    def __getitem__(self, path):
+        return self.values[path]
+
+    def __setitem__(self, path, value):
+        MockService.writes += 1
+        self.values[path] = value
+
+
+# settings with their defaults, as SettingsDevice creates them on a fresh device
+class MockSettings:
+
+    def __init__(self, bus, supportedSettings, eventCallback):
+        self.values = {name: setting[1] for name, setting in supportedSettings.items()}
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __setitem__(self, name, value):
+        self.values[name] = value
+
+
+# stand-in for the GLib main loop thread
+class IdleLoop:
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def idle_add(self, fn):
+        self.queue.put(fn)
+
+    def run(self):
+        while True:
+            fn = self.queue.get()
+            if fn is None:
+                return
+            fn()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def changes():
+    rnd = random.Random(0)
+    snapshot = bench_util.status_snapshot()
+    snapshot["alive"] = "ON"
+    result = [snapshot]
+    for i in range(ROUNDS):
+        # a status buffer decoded again: some of its values are reported unchanged
+        result.append({"current_temp_room": rnd.choice(("20.0", "20.5")),
+                       "operating_status": rnd.choice(("Off", "On(5)")),
+                       "error_code": "0", "alive": "ON"})
+    return result
+
+
+async def delay(export, loop):
+    export.idle_add = loop.idle_add
+    delays = []
+    for s in changes():
+        done = threading.Event()
+        t0 = time.perf_counter()
+        export.update(s)
+        loop.idle_add(done.set)
+        await asyncio.get_running_loop().run_in_executor(None, done.wait)
+        delays.append(time.perf_counter() - t0)
+    return delays
+
+
+def main():
+    export = DbusExport(MockService, bus="mock bus", settings_class=MockSettings)
+    export.create_services()
+    MockService.writes = 0
+    seq = changes()
+    for s in seq:
+        export.apply(s)
+    dedup = MockService.writes
+    naive = sum(len([key for key in s if key in export.paths]) + ("alive" in s) * len(export.lin_services) for s in seq)
+    bench_util.report("D-Bus writes, every reported value", naive / len(seq), "1/change")
+    bench_util.report("D-Bus writes, changed values only", dedup / len(seq), "1/change")
+
+    loop = IdleLoop()
+    delays = asyncio.run(delay(export, loop))
+    loop.stop()
+    bench_util.report("update to D-Bus thread: mean delay", sum(delays) / len(delays) * 1e6, "us")
+    bench_util.report("update to D-Bus thread: max delay", max(delays) * 1e6, "us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Replay a CPplus session through Lin.loop_serial and InetboxApp and report
+# the frames per second with debug logging switched off and on
+#
+
+import time
+import asyncio
+import bench_util
+
+CYCLES = 2000
+
+
+async def replay(lin_debug):
+    serial = bench_util.MemorySerial(on_write=lambda data: None)
+    lin = bench_util.make_lin(serial, lin_debug=lin_debug, inet_debug=lin_debug)
+    session = bench_util.cpplus_session()
+    t0 = time.perf_counter()
+    for _ in range(CYCLES):
+        for frame in session:
+            serial.feed(frame)
+            await lin.loop_serial()
+    return len(session) * CYCLES / (time.perf_counter() - t0)
+
+
+def main():
+    bench_util.mute_debug_log()
+    bench_util.report("debug off", asyncio.run(replay(False)), "frames/s")
+    bench_util.report("debug on", asyncio.run(replay(True)), "frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Cost of the LIN metrics (see src/metrics.py): the recorded CPplus traffic is fed frame by frame
+# through Lin.loop_serial with the metrics and through the former receive path without them (the
+# counters of InetboxApp are counted in both runs, they are 2 increments per status buffer).
+# Also checks that the counters and the 0x18 latency histogram match the fed traffic.
+#
+
+import sys
+import time
+import asyncio
+import bench_util
+from lin import Lin, RESP_D8_UPDATE, RESP_D8_IDLE, RESP_BUFFER_ACKN, log
+from metrics import Histogram
+
+ROUNDS = 2000 # CPplus cycles per run
+RUNS = 5
+MAX_OVERHEAD = 1.0 # us per frame
+
+
+# Lin without the metrics, the receive path as it was before
+class FormerLin(Lin):
+
+    async def loop_serial(self):
+        self.status_monitor()
+        n = self.serial.in_waiting
+        if n:
+            self.pin_map.dtoggle_led("lin_led")
+            self.rx_buf += self.serial.read(n)
+        while self.rx_buf and self._parse_frame():
+            pass
+
+    def _parse_frame(self):
+        buf = self.rx_buf
+        i = buf.find(0x55)
+        if i < 0:
+            buf.clear()
+            return False
+        if i:
+            del buf[:i]
+        if len(buf) < 2:
+            return self._frame_timeout()
+        raw_pid = buf[1]
+        if raw_pid == 0xd8:
+            del buf[:2]
+            self.rx_deadline = None
+            self.d8_alive = True
+            if self.app.status["alive"][0] != "ON":
+                self.app.status["alive"] = ["ON", True, False]
+                self.app.commit_status()
+            self.pin_map.set_led("lin_led", True)
+            if self.debug: log.debug("in1 < 00 55 d8")
+            s = False
+            if not(self.app.upload_wait): s = (self.app.upload_buffer or self.app.upload02_buffer)
+            if s:
+                self.app.upload_wait = 4
+                self.stop_async = True
+                if self.debug: log.debug("0x18 - update-requested")
+                self._send_answer(RESP_D8_UPDATE)
+            else:
+                self._send_answer(RESP_D8_IDLE)
+                if self.app.upload_wait:
+                    self.app.upload_wait -= 1
+            return True
+        if raw_pid == 0x7d:
+            del buf[:2]
+            self.rx_deadline = None
+            if self.response_waiting():
+                if self.debug: log.debug("in2 < 00 55 7d")
+                self._answer_tl_request()
+            return True
+        if len(buf) < 11:
+            return self._frame_timeout()
+        line = b'\x00' + buf[:11]
+        del buf[:11]
+        self.rx_deadline = None
+        self._process_frame(line)
+        return True
+
+    def _process_frame(self, line):
+        if self.debug: log.debug(f"in3 < {line.hex(' ')}")
+        if line.startswith(self.BUFFER_TRANSFER_ID) and (0x21 <= line[4] <= 0x26):
+            if not(self.store_cpp_segment(line[4] - 0x21, line[5:-1])):
+                return
+            if (line[4] == 0x26):
+                if (self.assemble_cpp_buffer()):
+                    self.prepare_tl_info_response(RESP_BUFFER_ACKN, "_send ackn-response for buffer delivery")
+            return
+        cmd = self.frame_dispatch.get(line)
+        if cmd is None:
+            return
+        cmd[0](cmd[1], cmd[2])
+
+
+def make(cls):
+    serial = bench_util.MemorySerial(on_write=lambda data: None)
+    return cls(serial, bench_util.PIN_MAP(bench_util.PIN_MAPS["RPi"]), False, False), serial
+
+
+async def feed(lin, serial, frames):
+    for frame in frames:
+        serial.feed(frame)
+        await lin.loop_serial()
+
+
+# time per frame in us, best of RUNS, both variants interleaved
+def per_frame(frames):
+    best = {Lin: None, FormerLin: None}
+    for _ in range(RUNS):
+        for cls in best:
+            lin, serial = make(cls)
+            t0 = time.perf_counter()
+            asyncio.run(feed(lin, serial, frames))
+            t = (time.perf_counter() - t0) / len(frames) * 1e6
+            best[cls] = t if best[cls] is None else min(best[cls], t)
+    return best[Lin], best[FormerLin]
+
+
+def micro(fn, n=200000):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    bench_util.mute_debug_log()
+    session = bench_util.cpplus_session()
+    frames = session * ROUNDS
+    with_metrics, former = per_frame(frames)
+    overhead = with_metrics - former
+    bench_util.report("frame without metrics", former, "us")
+    bench_util.report("frame with metrics", with_metrics, "us")
+    bench_util.report("metrics overhead", overhead, "us/frame")
+    histogram = Histogram()
+    bench_util.report("Histogram.add", micro(lambda: histogram.add(0.0003)), "us")
+    lin, serial = make(Lin)
+    asyncio.run(feed(lin, serial, session))
+    bench_util.report("Lin.metrics() snapshot", micro(lin.metrics, 20000), "us")
+
+    # the counters of one cycle, plus a lost sync (more garbage than the response to a 0x18 poll)
+    # and an unknown frame
+    lin, serial = make(Lin)
+    garbage = bytes(range(0x10, 0x1c))
+    unknown = bytes.fromhex("00 55 3c 03 06 b2 21 17 46 00 1f a6")
+    asyncio.run(feed(lin, serial, session + [garbage, unknown]))
+    m = lin.metrics()
+    d8 = sum(1 for frame in session if frame[2] == 0xd8)
+    ok = (m["frames"] == len(session) + 1 and m["d8_polls"] == d8 and sum(m["d8_latency"]["counts"]) == d8
+          and m["sync_lost"] == 1 and m["unknown_frames"] == 1 and m["assemble_failures"] == 0
+          and m["status_buffers"] == len(bench_util.STATUS_BUFFERS))
+    ok = ok and overhead < MAX_OVERHEAD
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Encode cost per message of the status PUBLISH packets: main.main building the topic string
+# and MQTTProto.publish_many building the packets with the former per-message allocations, versus
+# the cached status topics and the packet parts joined by MQTTProto.
+# The packets are compared byte by byte, then both are timed.
+#
+
+import sys
+import struct
+import timeit
+import bench_util
+from mqtt_async2 import MQTTProto, MQTTMessage
+
+STA_PREFIX = "service/truma/control_status/"
+ROUNDS = 5000
+
+
+# former MQTTProto.publish_many without the socket write
+def former_packets(msgs, dup=0):
+    pkt = bytearray()
+    hdr = bytearray(5)
+    for msg in msgs:
+        sz = 2 + len(msg.topic) + len(msg.message)
+        if msg.qos > 0:
+            sz += 2
+        hdr[0] = 0x30 | msg.qos << 1 | msg.retain | dup << 3
+        pkt += hdr[:MQTTProto._write_varint(None, hdr, 1, sz)]
+        pkt += struct.pack("!H", len(msg.topic))
+        pkt += msg.topic
+        if msg.qos > 0:
+            pkt += struct.pack("!H", msg.pid)
+        pkt += msg.message
+    return pkt
+
+
+def former(snapshot):
+    msgs = [MQTTMessage(STA_PREFIX + key, str(value), False, 1, pid + 1) for pid, (key, value) in enumerate(snapshot.items())]
+    return former_packets(msgs)
+
+
+STA_TOPICS = {}
+
+def cached(proto, snapshot):
+    msgs = []
+    for pid, (key, value) in enumerate(snapshot.items()):
+        topic = STA_TOPICS.get(key)
+        if topic is None:
+            topic = STA_TOPICS[key] = (STA_PREFIX + key).encode()
+        msgs.append(MQTTMessage(topic, str(value), False, 1, pid + 1))
+    return joined_packets(proto, msgs)
+
+
+# MQTTProto.publish_many without the socket write
+def joined_packets(proto, msgs):
+    parts = []
+    for msg in msgs:
+        proto._publish_parts(parts, msg)
+    return b"".join(parts)
+
+
+def main():
+    snapshot = bench_util.status_snapshot()
+    proto = MQTTProto(None, None, None, None)
+    if former(snapshot) != cached(proto, snapshot):
+        print("packets differ")
+        return 1
+    print(f"snapshot of {len(snapshot)} keys: packets identical")
+    t = timeit.timeit(lambda: former(snapshot), number=ROUNDS)
+    bench_util.report("per message allocations", t / ROUNDS / len(snapshot) * 1e6, "us/message")
+    t = timeit.timeit(lambda: cached(proto, snapshot), number=ROUNDS)
+    bench_util.report("topic cache and joined parts", t / ROUNDS / len(snapshot) * 1e6, "us/message")
+    # packets only, for the same messages
+    msgs = [MQTTMessage(STA_TOPICS[key], str(value), False, 1, pid + 1) for pid, (key, value) in enumerate(snapshot.items())]
+    t = timeit.timeit(lambda: former_packets(msgs), number=ROUNDS)
+    bench_util.report("packets only: per message allocations", t / ROUNDS / len(snapshot) * 1e6, "us/message")
+    t = timeit.timeit(lambda: joined_packets(proto, msgs), number=ROUNDS)
+    bench_util.report("packets only: joined parts", t / ROUNDS / len(snapshot) * 1e6, "us/message")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
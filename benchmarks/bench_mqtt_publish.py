@@ -0,0 +1,60 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Time to publish a full status snapshot with QoS 1 to the stand-in broker: one publish call
+# per key (each waits for its PUBACK) versus one publish_many batch, for several broker latencies
+#
+
+import sys
+import time
+import asyncio
+import bench_util
+from mqtt_broker import StandInBroker
+
+STA_PREFIX = "service/truma/control_status/"
+LATENCIES = (0.0, 0.002, 0.010) # seconds
+ROUNDS = 20
+
+
+async def per_key(client, snapshot):
+    for key, value in snapshot.items():
+        await client.publish(STA_PREFIX + key, str(value), qos=1)
+
+
+async def batch(client, snapshot):
+    await client.publish_many([(STA_PREFIX + key, str(value)) for key, value in snapshot.items()], qos=1)
+
+
+async def measure(latency, snapshot):
+    broker = await StandInBroker(latency).start()
+    client = await bench_util.mqtt_client(broker.port)
+    result = 0
+    for name, fn in (("per key", per_key), ("batch", batch)):
+        broker.received = 0
+        broker.writes = 0
+        t0 = time.perf_counter()
+        for _ in range(ROUNDS):
+            await fn(client, snapshot)
+        t = (time.perf_counter() - t0) / ROUNDS
+        if broker.received != ROUNDS * len(snapshot):
+            print(f"{name}: broker received {broker.received} of {ROUNDS * len(snapshot)} messages")
+            result = 1
+        bench_util.report(f"{name}, latency {latency * 1000:.0f} ms", t * 1000, "ms/snapshot")
+        bench_util.report(f"{name}, latency {latency * 1000:.0f} ms: writes", broker.writes / ROUNDS, "1/snapshot")
+    await client.disconnect()
+    await broker.stop()
+    return result
+
+
+async def run():
+    snapshot = bench_util.status_snapshot()
+    print(f"snapshot of {len(snapshot)} keys")
+    result = 0
+    for latency in LATENCIES:
+        result |= await measure(latency, snapshot)
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,160 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Feed a stream of PUBLISH packets of mixed sizes through MQTTProto.read_msg from an in-memory
+# socket, with the receive buffer of MQTTProto and with the former immutable bytes buffer.
+# The delivered messages are compared, then throughput, socket reads and the peak of the memory
+# allocated while receiving (traced in a second run) are reported.
+#
+
+import sys
+import time
+import random
+import asyncio
+import tracemalloc
+import struct
+import bench_util
+from mqtt_async2 import MQTTProto, CONN_CLOSED, PROTO_ERROR, is_awaitable, log
+
+PACKETS = 5000
+CHUNK = 1460 # bytes returned per socket read at most, like a TCP segment
+
+
+# socket returning the stream in chunks, writes (PUBACKs) are dropped
+class MemorySock:
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.reads = 0
+
+    async def read(self, n):
+        self.reads += 1
+        n = min(n, CHUNK)
+        got = bytes(self.data[self.pos:self.pos + n])
+        self.pos += len(got)
+        return got
+
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+# former receive buffer of MQTTProto: immutable bytes, re-sliced on every read
+# (read_msg reduced to PUBLISH packets)
+class BytesBufferProto(MQTTProto):
+
+    async def _as_read(self, n):
+        while self._sock:
+            missing = n - len(self._bytes_buf)
+            if missing > 0:
+                if missing < 128:
+                    missing = 128
+                got = await self._sock.read(missing)
+                if len(got) == 0:
+                    raise OSError(-1, CONN_CLOSED)
+                self._bytes_buf += got
+                missing = n - len(self._bytes_buf)
+            if missing <= 0:
+                res = self._bytes_buf[:n]
+                self._bytes_buf = self._bytes_buf[n:]
+                return res
+        raise OSError(-1, CONN_CLOSED)
+    _bytes_buf = b''
+
+    async def _read_varint(self):
+        n = 0
+        sh = 0
+        while 1:
+            res = await self._as_read(1)
+            b = res[0]
+            n |= (b & 0x7f) << sh
+            if not b & 0x80:
+                return n
+            sh += 7
+
+    async def read_msg(self):
+        res = await self._as_read(1)
+        op = res[0]
+        if (op & 0xf0) != 0x30:
+            raise OSError(-1, PROTO_ERROR, "bad op", op)
+        sz = await self._read_varint()
+        topic_len = await self._as_read(2)
+        topic_len = (topic_len[0] << 8) | topic_len[1]
+        topic = await self._as_read(topic_len)
+        sz -= topic_len + 2
+        qos = (op>>1) & 3
+        pid = None
+        if qos:
+            pid = await self._as_read(2)
+            pid = pid[0] << 8 | pid[1]
+            sz -= 2
+        msg = await self._as_read(sz)
+        log.debug("dispatch pub %s pid=%s qos=%d", topic, pid, qos)
+        cb = self._subs_cb(topic, msg, bool(op & 0x01), qos)
+        if is_awaitable(cb):
+            await cb
+        if qos == 1:
+            pkt = bytearray(b"\x40\x02\0\0")
+            struct.pack_into("!H", pkt, 2, pid)
+            async with self._lock:
+                await self._as_write(pkt)
+        return op>>4
+
+
+# stream of PUBLISH packets: short status values, some JSON sized and a few large payloads
+def stream():
+    rnd = random.Random(0)
+    topics = [f"service/truma/set/{key}".encode() for key in bench_util.status_snapshot()]
+    data = bytearray()
+    for i in range(PACKETS):
+        topic = rnd.choice(topics)
+        size = rnd.choice((1, 2, 4, 8, 16, 200, 600, 3000))
+        payload = bytes(rnd.getrandbits(8) for _ in range(size))
+        qos = rnd.randrange(2)
+        body = len(topic).to_bytes(2, "big") + topic + ((i % 65535 + 1).to_bytes(2, "big") if qos else b"") + payload
+        sz = len(body)
+        varint = bytearray()
+        while sz > 0x7f:
+            varint.append((sz & 0x7f) | 0x80)
+            sz >>= 7
+        varint.append(sz)
+        data += bytes([0x30 | qos << 1]) + varint + body
+    return bytes(data)
+
+
+async def receive(cls, data, on_msg):
+    proto = cls(on_msg, None, None, None)
+    proto._sock = MemorySock(data)
+    t0 = time.perf_counter()
+    for _ in range(PACKETS):
+        await proto.read_msg()
+    return time.perf_counter() - t0, proto._sock.reads
+
+
+async def run():
+    data = stream()
+    print(f"{PACKETS} packets, {len(data)} bytes")
+    results = {}
+    for name, cls in (("bytes buffer", BytesBufferProto), ("bytearray with cursor", MQTTProto)):
+        received = []
+        t, reads = await receive(cls, data, lambda topic, msg, retained, qos: received.append((topic, hash(msg), qos)))
+        results[name] = received
+        tracemalloc.start()
+        await receive(cls, data, lambda *_: None)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        bench_util.report(f"{name}: throughput", PACKETS / t, "msg/s")
+        bench_util.report(f"{name}: socket reads", reads, "")
+        bench_util.report(f"{name}: peak allocation", peak / 1024, "KiB")
+    if results["bytes buffer"] != results["bytearray with cursor"]:
+        print("received messages differ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
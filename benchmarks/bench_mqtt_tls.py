@@ -0,0 +1,93 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# TLS connections to the stand-in broker with a self-signed certificate (created with the
+# openssl command line tool): time per connect with a full handshake and with the resumed
+# session of the previous connection (on a remote broker, resuming also saves the transfer and
+# the verification of the certificate chain), and a reconnect of MQTTClient after the broker dropped
+# the connection, which must resume the session.
+#
+
+import os
+import sys
+import ssl
+import time
+import asyncio
+import tempfile
+import subprocess
+import bench_util
+import mqtt_async2
+from mqtt_async2 import MQTTProto, tls_context
+from mqtt_broker import StandInBroker
+
+CONNECTS = 50
+
+
+def self_signed_cert(directory):
+    cert = os.path.join(directory, "broker.pem")
+    key = os.path.join(directory, "broker.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                    "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+                    "-keyout", key, "-out", cert], check=True, capture_output=True)
+    return cert, key
+
+
+async def connects(port, ctx, resume):
+    reused = 0
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    for _ in range(CONNECTS):
+        if not resume:
+            ctx.session = None
+        proto = MQTTProto(None, None, None, None)
+        await proto.connect(("127.0.0.1", port), "bench", True, ssl_params=ctx, server_hostname="127.0.0.1")
+        reused += proto._sock.tls_object().session_reused
+        await proto.disconnect()
+    return (time.perf_counter() - t0) / CONNECTS, (time.process_time() - cpu0) / CONNECTS, reused
+
+
+async def reconnect(broker, ca_certs):
+    mqtt_async2._CONN_DELAY = 0.05
+    client = await bench_util.mqtt_client(broker.port, ssl_params={"ca_certs": ca_certs})
+    proto = client._proto
+    broker.drop()
+    await client.publish("service/truma/control_status/alive", "ON", qos=1)
+    reused = client._proto is not proto and client._proto._sock.tls_object().session_reused
+    await client.disconnect()
+    return reused
+
+
+async def run(cert, key):
+    server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_ctx.load_cert_chain(cert, key)
+    broker = await StandInBroker(ssl=server_ctx).start()
+    ctx = tls_context(ca_certs=cert)
+    result = 0
+    for name, resume in (("full handshake", False), ("resumed session", True)):
+        t, cpu, reused = await connects(broker.port, ctx, resume)
+        bench_util.report(f"{name}: connect", t * 1000, "ms")
+        bench_util.report(f"{name}: cpu time (client and broker)", cpu * 1000, "ms")
+        bench_util.report(f"{name}: sessions reused", reused, f"of {CONNECTS}")
+    if not await reconnect(broker, cert):
+        print("MQTTClient reconnect did not resume the TLS session")
+        result = 1
+    else:
+        print("MQTTClient reconnect resumed the TLS session")
+    await broker.stop()
+    return result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            cert, key = self_signed_cert(directory)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"cannot create a self-signed certificate: {e}")
+            return 1
+        return asyncio.run(run(cert, key))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# QoS 1 throughput of several concurrent publishers (status, command echo, telemetry) sharing one
+# connection to a slow stand-in broker, for several in-flight window sizes. A window of 1 is the
+# former behaviour of one outstanding pub at a time. In the last run the broker drops the
+# connection in the middle: all messages must arrive, the last value per topic must be the last
+# one published.
+#
+
+import sys
+import time
+import asyncio
+import bench_util
+import mqtt_async2
+from mqtt_broker import StandInBroker
+
+LATENCY = 0.010 # seconds
+WINDOWS = (1, 4, 16, 64)
+PUBLISHERS = ("status", "echo", "telemetry")
+MESSAGES = 100 # per publisher
+
+
+async def publisher(client, name):
+    futs = []
+    for i in range(MESSAGES):
+        futs.append(await client.publish_async(f"service/truma/{name}", str(i), qos=1))
+    await asyncio.gather(*futs)
+
+
+async def measure(window, drop=False):
+    broker = await StandInBroker(LATENCY).start()
+    client = await bench_util.mqtt_client(broker.port, max_inflight=window, response_time=2)
+    # a retransmitted pub may be the first copy to arrive, so the distinct messages are counted
+    seen = set()
+    broker.on_publish = lambda topic, payload: seen.add((topic, payload))
+    t0 = time.perf_counter()
+    tasks = [asyncio.create_task(publisher(client, name)) for name in PUBLISHERS]
+    if drop:
+        await asyncio.sleep(LATENCY * 3)
+        broker.drop()
+    await asyncio.gather(*tasks)
+    t = time.perf_counter() - t0
+    total = MESSAGES * len(PUBLISHERS)
+    result = 0
+    if len(seen) < total:
+        print(f"window {window}: broker received {len(seen)} of {total} messages")
+        result = 1
+    for name in PUBLISHERS:
+        if broker.last.get(f"service/truma/{name}".encode()) != str(MESSAGES - 1).encode():
+            print(f"window {window}: wrong last value for {name}")
+            result = 1
+    label = f"window {window}" + (", connection dropped" if drop else "")
+    bench_util.report(label, total / t, "msg/s")
+    await client.disconnect()
+    await broker.stop()
+    return result
+
+
+async def run():
+    mqtt_async2._CONN_DELAY = 0.1
+    result = 0
+    for window in WINDOWS:
+        result |= await measure(window)
+    result |= await measure(16, drop=True)
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,84 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Broker outage with the offline store of MQTTClient: the status snapshots published while the
+# broker is down must not stall the publisher, and memory and disk use must stay bounded. When
+# the broker is back, the time until the store has been drained is measured, and the broker must
+# have received the latest value of every topic.
+#
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+import tracemalloc
+import bench_util
+import mqtt_async2
+from offline_store import OfflineStore
+from mqtt_broker import StandInBroker
+
+STA_PREFIX = "service/truma/control_status/"
+CYCLES = 5000 # status snapshots during the outage
+SEGMENT_SIZE = 16384
+
+
+def disk_use(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+async def run(directory):
+    mqtt_async2._CONN_DELAY = 0.05
+    mqtt_async2.log.setLevel(logging.ERROR) # no reconnect warnings during the outage
+    keys = list(bench_util.status_snapshot())
+    store = OfflineStore(directory, segment_size=SEGMENT_SIZE)
+    broker = await StandInBroker().start()
+    port = broker.port
+    client = await bench_util.mqtt_client(port, offline_store=store)
+    await broker.stop()
+    while client._proto is not None:
+        await asyncio.sleep(0.01)
+
+    tracemalloc.start()
+    max_disk = 0
+    t0 = time.perf_counter()
+    for i in range(CYCLES):
+        await client.publish_many([(STA_PREFIX + key, str(i)) for key in keys], qos=1)
+        if not i % 100:
+            max_disk = max(max_disk, disk_use(directory))
+    t = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    bench_util.report("outage: publish", t / CYCLES * 1000, "ms/snapshot")
+    bench_util.report("outage: peak allocation", peak / 1024, "KiB")
+    bench_util.report("outage: max disk use", max_disk / 1024, "KiB")
+    bench_util.report("outage: messages in store", len(store), "")
+
+    broker = await StandInBroker().start(port)
+    t0 = time.perf_counter()
+    while len(store) and time.perf_counter() - t0 < 10:
+        await asyncio.sleep(0.001)
+    bench_util.report("drain after reconnect", (time.perf_counter() - t0) * 1000, "ms")
+    bench_util.report("drain: messages received by broker", broker.received, "")
+    result = 0
+    for key in keys:
+        if broker.last.get((STA_PREFIX + key).encode()) != str(CYCLES - 1).encode():
+            print(f"broker is missing the latest value of {key}")
+            result = 1
+    if disk_use(directory) > SEGMENT_SIZE:
+        print("offline store not released")
+        result = 1
+    await client.disconnect()
+    await broker.stop()
+    return result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
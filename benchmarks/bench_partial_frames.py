@@ -0,0 +1,68 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Feed truncated LIN frames through a loopback serial port and check that
+# - the truncated frames are dropped and counted
+# - the asyncio loop stays responsive meanwhile
+# - the receiver resynchronizes on the next complete frame
+#
+
+import sys
+import time
+import asyncio
+import bench_util
+import serial as pyserial
+
+TICK = 0.005       # period of the responsiveness probe
+MAX_LAG = 0.050    # accepted delay of the probe, a blocking receive would never return
+
+# header of a diagnostic frame (PID 0x3C) with 3 of 9 bytes
+PARTIAL_FRAME = bytes.fromhex("00 55 3c 03 06 b2")
+# 0x18 poll, the answer is written back into the loopback port
+D8_POLL = bytes.fromhex("00 55 d8")
+
+
+async def probe(stats, t_end):
+    while time.monotonic() < t_end:
+        t0 = time.monotonic()
+        await asyncio.sleep(TICK)
+        stats["lag"] = max(stats["lag"], time.monotonic() - t0 - TICK)
+
+
+async def lin_loop(lin, t_end):
+    while time.monotonic() < t_end:
+        await lin.loop_serial()
+        if not(lin.stop_async):
+            await asyncio.sleep(0.001)
+
+
+async def feeder(serial, count):
+    for _ in range(count):
+        serial.write(PARTIAL_FRAME)
+        await asyncio.sleep(0.05)
+    serial.write(D8_POLL)
+
+
+async def run(count):
+    serial = pyserial.serial_for_url('loop://', baudrate=9600)
+    lin = bench_util.make_lin(serial)
+    stats = {"lag": 0.0}
+    t_end = time.monotonic() + count * 0.05 + 0.5
+    await asyncio.gather(probe(stats, t_end), lin_loop(lin, t_end), feeder(serial, count))
+    return lin, stats
+
+
+def main():
+    count = 50
+    lin, stats = asyncio.run(run(count))
+    bench_util.report("truncated frames dropped", lin.cnt_truncated, "")
+    bench_util.report("max. event loop lag", stats["lag"] * 1000, "ms")
+    bench_util.report("0x18 polls answered", lin.app.status["alive"][0] == "ON", "")
+    ok = lin.cnt_truncated == count and stats["lag"] < MAX_LAG and lin.d8_alive
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
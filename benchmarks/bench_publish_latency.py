@@ -0,0 +1,90 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Latency from the reassembly of a status buffer on the LIN bus to the PUBLISH of the changed
+# value arriving at the stand-in broker. The CPplus is simulated by feeding the frames of a
+# 0x14 0x33 status buffer download with a changed room temperature to Lin.loop_serial, one frame
+# every FRAME_PERIOD, at random times.
+# main.main reacts to the status event of InetboxApp; for comparison, the former fixed publish
+# cycle is run as well, scaled down from 10 s to 1 s.
+#
+
+import sys
+import time
+import random
+import asyncio
+import bench_util
+import main
+from mqtt_broker import StandInBroker
+
+ROUNDS = 10
+FRAME_PERIOD = 0.010 # seconds between two LIN frames
+FIXED_CYCLE = 1.0
+DEBOUNCE = main.PUBLISH_DEBOUNCE # default of main
+TOPIC = (main.STA_PREFIX + "current_temp_room").encode()
+
+
+class Connect:
+    client = None
+
+
+# former main.main: publish every FIXED_CYCLE seconds
+async def fixed_cycle():
+    while True:
+        await asyncio.sleep(FIXED_CYCLE)
+        version, s = main.lin.app.take_status()
+        await main.connect.client.publish_many([(main.STA_PREFIX + key, str(s[key])) for key in s], qos=1)
+
+
+async def feed(serial, frames):
+    for frame in frames:
+        await asyncio.sleep(FRAME_PERIOD)
+        serial.feed(frame)
+        await main.lin.loop_serial()
+
+
+async def measure(name, publisher, debounce=0.0):
+    broker = await StandInBroker().start()
+    serial = bench_util.MemorySerial(on_write=lambda data: None)
+    main.lin = bench_util.make_lin(serial)
+    main.connect = Connect()
+    main.connect.client = await bench_util.mqtt_client(broker.port)
+    main.PUBLISH_DEBOUNCE = debounce
+    pub = asyncio.create_task(publisher())
+    # initial status of all buffers
+    await feed(serial, bench_util.cpplus_session())
+    await asyncio.sleep(FIXED_CYCLE * 1.5)
+
+    arrived = asyncio.Event()
+    broker.on_publish = lambda topic, payload: arrived.set() if topic == TOPIC else None
+    buf_id, data = bench_util.STATUS_BUFFERS[0]
+    data = bytearray(data)
+    rnd = random.Random(0)
+    latencies = []
+    for i in range(ROUNDS):
+        await asyncio.sleep(rnd.uniform(0.0, FIXED_CYCLE))
+        data[16] = 0xA5 if data[16] != 0xA5 else 0x9B # current_temp_room
+        arrived.clear()
+        await feed(serial, bench_util.buffer_download(buf_id, bytes(data)))
+        t0 = time.monotonic()
+        await asyncio.wait_for(arrived.wait(), FIXED_CYCLE * 2)
+        latencies.append(time.monotonic() - t0)
+    pub.cancel()
+    await main.connect.client.disconnect()
+    await broker.stop()
+    bench_util.report(f"{name}: mean", sum(latencies) / len(latencies) * 1000, "ms")
+    bench_util.report(f"{name}: max", max(latencies) * 1000, "ms")
+    return max(latencies)
+
+
+async def run():
+    bench_util.mute_debug_log()
+    await measure(f"fixed cycle of {FIXED_CYCLE:.0f} s", fixed_cycle)
+    await measure("status event", main.main)
+    await measure(f"status event, debounce {DEBOUNCE * 1000:.0f} ms", main.main, DEBOUNCE)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,165 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Replay of LIN captures (see src/capture.py) through Lin.loop_serial and InetboxApp as fast as
+# possible, for catching performance regressions of the parser before a release:
+#   - frames per second, best of several runs
+#   - time per frame of the stages: sync search and polls (Lin._parse_frame without the frame
+#     processing), dispatch (Lin._process_frame without the reassembly), reassembly of the buffer
+#     downloads (store_cpp_segment, assemble_cpp_buffer without the decoding) and decoding
+#     (InetboxApp.process_status_buffer_update); the stages are timed in a separate run, as the
+#     timing wrappers slow it down
+#   - memory: peak of the traced allocations (tracemalloc) and the memory blocks retained per
+#     frame; CPython has no counter of allocation events
+#
+# Without capture files, a capture of the LIN master simulator is recorded first.
+#
+#   python3 benchmarks/bench_replay.py [capture ...] [--save results.json] [--baseline results.json]
+#
+# With --baseline, the exit code is 1 if the frames per second of a capture dropped by more than
+# --tolerance (default 20 %) against the saved results.
+#
+
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import bench_util
+import linsim
+from capture import RecordingSerial, read_capture, RX
+
+CYCLES = 200 # of the simulator capture
+RUNS = 5
+STAGES = ("sync search and polls", "dispatch", "reassembly", "decode")
+
+
+async def record(path):
+    import serial as pyserial
+    port = pyserial.serial_for_url("loop://", baudrate=9600, timeout=0)
+    recorder = RecordingSerial(port, path)
+    lin = bench_util.make_lin(recorder)
+    lin.app.set_status("target_temp_room", "20")
+    master = linsim.LinMaster(port, lin, slot_time=0)
+    await master.run(CYCLES)
+    recorder.close()
+
+
+async def replay(lin, serial, chunks):
+    for chunk in chunks:
+        serial.feed(chunk)
+        await lin.loop_serial()
+
+
+def new_lin():
+    serial = bench_util.MemorySerial(on_write=lambda data: None)
+    return bench_util.make_lin(serial), serial
+
+
+# wrap a method of an instance, the time of the calls is added to times[name]
+def timed(obj, attr, times, name, count=None):
+    fn = getattr(obj, attr)
+    def wrapper(*args):
+        t = time.perf_counter_ns()
+        result = fn(*args)
+        times[name] += time.perf_counter_ns() - t
+        if count is not None and result:
+            count[0] += 1
+        return result
+    setattr(obj, attr, wrapper)
+
+
+def measure(chunks):
+    # stages and number of frames
+    lin, serial = new_lin()
+    times = dict.fromkeys(("parse", "frame", "store", "assemble", "decode"), 0)
+    frames = [0]
+    timed(lin, "_parse_frame", times, "parse", frames)
+    timed(lin, "_process_frame", times, "frame")
+    timed(lin, "store_cpp_segment", times, "store")
+    timed(lin, "assemble_cpp_buffer", times, "assemble")
+    timed(lin.app, "process_status_buffer_update", times, "decode")
+    asyncio.run(replay(lin, serial, chunks))
+    frames = frames[0]
+    stages = {
+        "sync search and polls": times["parse"] - times["frame"],
+        "dispatch": times["frame"] - times["store"] - times["assemble"],
+        "reassembly": times["store"] + times["assemble"] - times["decode"],
+        "decode": times["decode"],
+    }
+    stages = {name: t / frames / 1000 for name, t in stages.items()}
+
+    # frames per second
+    best = None
+    for _ in range(RUNS):
+        lin, serial = new_lin()
+        t0 = time.perf_counter()
+        asyncio.run(replay(lin, serial, chunks))
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+
+    # memory
+    lin, serial = new_lin()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    asyncio.run(replay(lin, serial, chunks))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+    return {"frames": frames, "frames_per_s": frames / best, "stages_us": stages,
+            "peak_kib": peak / 1024, "blocks_per_frame": blocks / frames}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay benchmark of LIN captures")
+    parser.add_argument("captures", nargs="*")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    bench_util.mute_debug_log()
+
+    with tempfile.TemporaryDirectory() as directory:
+        captures = args.captures
+        if not captures:
+            captures = [os.path.join(directory, "linsim.cap")]
+            asyncio.run(record(captures[0]))
+        results = {}
+        for path in captures:
+            chunks = [data for t, direction, data in read_capture(path) if direction == RX]
+            name = os.path.basename(path)
+            r = results[name] = measure(chunks)
+            bench_util.report(f"{name}: frames", r["frames"], "")
+            bench_util.report(f"{name}: replay", r["frames_per_s"], "frames/s")
+            for stage in STAGES:
+                bench_util.report(f"{name}: {stage}", r["stages_us"][stage], "us/frame")
+            bench_util.report(f"{name}: peak traced memory", r["peak_kib"], "KiB")
+            bench_util.report(f"{name}: retained blocks", r["blocks_per_frame"], "1/frame")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    result = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, r in results.items():
+            if name not in baseline:
+                continue
+            ratio = r["frames_per_s"] / baseline[name]["frames_per_s"]
+            bench_util.report(f"{name}: against baseline", ratio * 100, "%")
+            if ratio < 1 - args.tolerance:
+                print(f"{name}: replay is {(1 - ratio) * 100:.0f}% slower than the baseline")
+                result = 1
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Compare the polling receive loop with the event driven receive on an idle LIN bus
+#
+# The polling mode runs on serial_for_url('loop://'). This port has no file descriptor,
+# so the event driven mode uses a pty pair, which behaves like the FTDI device node.
+#
+
+import os
+import time
+import asyncio
+import bench_util
+import serial as pyserial
+
+DURATION = 5 # seconds
+
+
+async def run_poll(lin):
+    calls = 0
+    t_end = time.monotonic() + DURATION
+    while time.monotonic() < t_end:
+        await lin.loop_serial()
+        calls += 1
+        if not(lin.stop_async):
+            await asyncio.sleep(0.001)
+    return calls
+
+
+async def run_event(lin):
+    calls = 0
+    loop = asyncio.get_running_loop()
+    if not lin.attach_reader(loop):
+        raise RuntimeError("serial port has no file descriptor")
+    t_end = time.monotonic() + DURATION
+    try:
+        while time.monotonic() < t_end:
+            try:
+                await asyncio.wait_for(lin.wait_rx(), t_end - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            await lin.loop_serial()
+            calls += 1
+    finally:
+        lin.detach_reader(loop)
+    return calls
+
+
+def measure(name, coro_fn, lin):
+    cpu0 = time.process_time()
+    calls = asyncio.run(coro_fn(lin))
+    cpu = time.process_time() - cpu0
+    bench_util.report(f"{name}: wakeups", calls / DURATION, "1/s")
+    bench_util.report(f"{name}: cpu time", cpu / DURATION * 1000, "ms/s")
+
+
+def main():
+    serial = pyserial.serial_for_url('loop://', baudrate=9600)
+    measure("poll (loop://)", run_poll, bench_util.make_lin(serial))
+
+    master, slave = os.openpty()
+    serial = pyserial.serial_for_url(os.ttyname(slave), baudrate=9600)
+    measure("event (pty)", run_event, bench_util.make_lin(serial))
+    serial.close()
+    os.close(master)
+    os.close(slave)
+
+
+if __name__ == "__main__":
+    main()
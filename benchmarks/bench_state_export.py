@@ -0,0 +1,76 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Cost of exporting the status for other scripts over a sequence of publish cycles: the former
+# per-key files written by main.write_to_file versus the snapshot of StateExport (with and
+# without the per-key compatibility files).
+# The cycles are derived from the recorded status: one full snapshot, then cycles with a reported
+# temperature (often the same as before) and heartbeats with the unchanged alive status.
+#
+
+import os
+import sys
+import time
+import random
+import tempfile
+import bench_util
+from state_export import StateExport
+
+CYCLES = 2000
+
+
+# main.write_to_file before the state export
+def write_to_file(dir_path, key, value):
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(dir_path, key)
+    with open(file_path, 'w') as f:
+        f.write(str(value) + '\n')
+
+
+def cycles():
+    rnd = random.Random(0)
+    snapshot = bench_util.status_snapshot()
+    snapshot["alive"] = "ON"
+    result = [snapshot]
+    for i in range(CYCLES):
+        r = rnd.random()
+        if r < 0.6:
+            result.append({"current_temp_room": rnd.choice(("20.0", "20.5", "21.0"))})
+        elif r < 0.8:
+            result.append({"current_temp_water": rnd.choice(("55.0", "55.5"))})
+        else:
+            result.append({"alive": "ON"})
+    return result
+
+
+def per_key(directory, seq):
+    writes = 0
+    t0 = time.perf_counter()
+    for s in seq:
+        for key in s:
+            write_to_file(os.path.join(directory, "truma"), key, s[key])
+            writes += 1
+    return time.perf_counter() - t0, writes
+
+
+def snapshot(directory, seq, compat=False):
+    export = StateExport(os.path.join(directory, "truma", "status.json"), os.path.join(directory, "truma") if compat else None)
+    t0 = time.perf_counter()
+    for s in seq:
+        export.update(s)
+    return time.perf_counter() - t0, export.writes
+
+
+def main():
+    seq = cycles()
+    for name, fn in (("per-key files", per_key), ("snapshot", snapshot), ("snapshot + per-key files", lambda d, s: snapshot(d, s, True))):
+        with tempfile.TemporaryDirectory() as directory:
+            t, writes = fn(directory, seq)
+        bench_util.report(f"{name}: time", t / len(seq) * 1e6, "us/cycle")
+        bench_util.report(f"{name}: files written", writes / len(seq), "1/cycle")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Delay between inetbox2mqtt replacing the status snapshot and RpiTemperature.py noticing it:
+# with an inotify watch on the snapshot directory (as in RpiTemperature.py, with select instead
+# of the GLib main loop) the reader wakes up once per written snapshot; the former 10 s poll
+# timer notices a change after 5 s on average and wakes up 360 times per hour in any case.
+#
+
+import os
+import sys
+import time
+import random
+import select
+import tempfile
+import threading
+import bench_util
+import inotify
+from state_export import StateExport
+
+ROUNDS = 200
+POLL_INTERVAL = 10
+
+
+def writer(export, times, done):
+    rnd = random.Random(0)
+    for i in range(ROUNDS):
+        time.sleep(rnd.uniform(0.001, 0.005))
+        times.append(time.perf_counter())
+        export.update({"current_temp_room": f"{20 + i % 10}.0", "alive": "ON"})
+    done.set()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        export = StateExport(os.path.join(directory, "truma", "status.json"))
+        os.makedirs(os.path.dirname(export.path))
+        watcher = inotify.Inotify()
+        watcher.add_watch(os.path.dirname(export.path), inotify.IN_MOVED_TO | inotify.IN_DELETE)
+        name = os.path.basename(export.path)
+        times = []
+        delays = []
+        wakeups = 0
+        done = threading.Event()
+        thread = threading.Thread(target=writer, args=(export, times, done))
+        thread.start()
+        while not done.is_set() or len(delays) < len(times):
+            if not select.select([watcher], [], [], 0.1)[0]:
+                continue
+            t = time.perf_counter()
+            wakeups += 1
+            for wd, mask, event_name in watcher.read():
+                if event_name == name and len(delays) < len(times):
+                    delays.append(t - times[len(delays)])
+        thread.join()
+        watcher.close()
+    bench_util.report("inotify: mean delay", sum(delays) / len(delays) * 1e6, "us")
+    bench_util.report("inotify: max delay", max(delays) * 1e6, "us")
+    bench_util.report("inotify: wakeups per snapshot", wakeups / ROUNDS, "")
+    bench_util.report("poll timer: mean delay", POLL_INTERVAL / 2 * 1e6, "us")
+    bench_util.report("poll timer: wakeups per hour", 3600 / POLL_INTERVAL, "")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Decode a corpus of status buffers with the compiled struct decoders of InetboxApp and with
+# the former table walker: the results are compared first, then both are timed
+#
+
+import sys
+import random
+import timeit
+import bench_util
+from inetboxapp import InetboxApp
+
+ROUNDS = 20000
+
+
+# former implementation of InetboxApp.process_status_buffer_update
+def table_walker(buf_id, status_buffer):
+    status_buffer_map = InetboxApp.STATUS_BUFFER_TYPES[buf_id]
+    parsed_status_buffer = {}
+    val = 0
+    keys = list(status_buffer_map.keys())
+    keys.sort()
+    for key in keys:
+        val_a = val
+        val += status_buffer_map[key][1]
+        if status_buffer_map[key][2]:
+            status_key = status_buffer_map[key][0]
+            if (status_key == "display"):
+                parsed_status_buffer[status_key] = [status_buffer[val_a:val].hex(" "), True, False]
+            else:
+                parsed_status_buffer[status_key] = [int.from_bytes(status_buffer[val_a:val],"little"), True, False]
+    return parsed_status_buffer
+
+
+def decoder(buf_id, status_buffer):
+    dec = InetboxApp.STATUS_BUFFER_DECODERS[buf_id]
+    parsed_status_buffer = {}
+    for status_key, val in zip(dec.names, dec.decode(status_buffer)):
+        parsed_status_buffer[status_key] = [val, True, False]
+    return parsed_status_buffer
+
+
+# recorded buffers plus random buffers for all layouts, as views into a download buffer like Lin
+def corpus():
+    rnd = random.Random(0)
+    buffers = list(bench_util.STATUS_BUFFERS)
+    for buf_id in InetboxApp.STATUS_BUFFER_TYPES:
+        for _ in range(50):
+            buffers.append((buf_id, bytes(rnd.getrandbits(8) for _ in range(26))))
+    return [(buf_id, memoryview(bytearray(10) + data)[10:]) for buf_id, data in buffers]
+
+
+def main():
+    buffers = corpus()
+    for buf_id, data in buffers:
+        if decoder(buf_id, data) != table_walker(buf_id, data):
+            print(f"decoder mismatch: {buf_id.hex(' ')} {data.hex(' ')}")
+            return 1
+    print(f"{len(buffers)} buffers: results identical")
+    recorded = buffers[:len(bench_util.STATUS_BUFFERS)]
+    for name, fn in (("table walker", table_walker), ("struct decoder", decoder)):
+        t = timeit.timeit(lambda: [fn(buf_id, data) for buf_id, data in recorded], number=ROUNDS)
+        bench_util.report(f"{name}", t / ROUNDS / len(recorded) * 1e6, "us/buffer")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Cost of reading the two Truma temperatures as a local reader like RpiTemperature.py: the
+# former per-key files, the JSON snapshot of StateExport and the shared memory segment of
+# StatusShm. A writer process then updates the segment continuously while a reader process
+# checks that it never sees a torn update (both temperatures are always written together) and
+# measures the longest read, the reader waits for the writer instead of giving up.
+#
+
+import os
+import sys
+import time
+import timeit
+import tempfile
+import multiprocessing
+import bench_util
+from inetboxapp import InetboxApp
+from state_export import StateExport
+from status_shm import StatusShm, StatusShmReader
+
+ROUNDS = 20000
+CHECK_TIME = 2.0 # seconds
+KEYS = ("current_temp_room", "current_temp_water")
+
+
+# RpiTemperature.update_temp before the snapshot
+def read_files(directory):
+    values = []
+    for key in KEYS:
+        file = os.path.join(directory, key)
+        if os.path.exists(file):
+            with open(file, 'r') as fd:
+                values.append(float(fd.read().strip()))
+    return values
+
+
+def read_snapshot(path):
+    state = StateExport.read(path)
+    return [float(state[key]) for key in KEYS]
+
+
+def read_shm(reader):
+    return [reader.number(key) for key in KEYS]
+
+
+def writer(path, stop):
+    shm = StatusShm(path, InetboxApp.STATUS_CONVERSION_FUNCTIONS)
+    i = 0
+    while not stop.is_set():
+        i += 1
+        shm.update({"current_temp_room": i, "current_temp_water": i, "clock": f"{i % 24:02d}:00"})
+
+
+def check(path):
+    stop = multiprocessing.Event()
+    StatusShm(path, InetboxApp.STATUS_CONVERSION_FUNCTIONS).close()
+    proc = multiprocessing.Process(target=writer, args=(path, stop))
+    proc.start()
+    reader = StatusShmReader(path)
+    reads = torn = 0
+    longest = 0.0
+    t_end = time.monotonic() + CHECK_TIME
+    while time.monotonic() < t_end:
+        t0 = time.perf_counter()
+        values = reader.read()
+        longest = max(longest, time.perf_counter() - t0)
+        reads += 1
+        if values["current_temp_room"][1] != values["current_temp_water"][1]:
+            torn += 1
+    stop.set()
+    proc.join()
+    reader.close()
+    return reads, torn, longest
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        export = StateExport(os.path.join(directory, "status.json"), directory)
+        export.update({"current_temp_room": "20.5", "current_temp_water": "55.0"})
+        shm_path = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else directory, f"bench-status-{os.getpid()}")
+        shm = StatusShm(shm_path, InetboxApp.STATUS_CONVERSION_FUNCTIONS)
+        shm.update({"current_temp_room": "20.5", "current_temp_water": "55.0"})
+        reader = StatusShmReader(shm_path)
+        for name, fn in (("per-key files", lambda: read_files(directory)),
+                         ("JSON snapshot", lambda: read_snapshot(export.path)),
+                         ("shared memory", lambda: read_shm(reader))):
+            assert fn() == [20.5, 55.0], name
+            t = timeit.timeit(fn, number=ROUNDS) / ROUNDS
+            bench_util.report(f"{name}: read both temperatures", t * 1e6, "us")
+        reader.close()
+        shm.close()
+        reads, torn, longest = check(shm_path)
+        os.remove(shm_path)
+    bench_util.report("concurrent writer: reads", reads, "")
+    bench_util.report("concurrent writer: torn reads", torn, "")
+    bench_util.report("concurrent writer: longest read", longest * 1000, "ms")
+    return 1 if torn else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Common helpers for the benchmarks in this directory
+#
+# The benchmarks run from a repository checkout, e.g.:
+#     python3 benchmarks/bench_rx_mode.py
+#
+
+import os
+import sys
+import logging
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lib"))
+
+from tools import PIN_MAP, PIN_MAPS
+# frames of a status buffer download from CPplus and the recorded status buffers, as sent by the
+# LIN master simulator
+from linsim import buffer_download, STATUS_BUFFERS
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+
+
+# create a Lin instance on the given serial port
+def make_lin(serial, lin_debug=False, inet_debug=False):
+    from lin import Lin
+    return Lin(serial, PIN_MAP(PIN_MAPS["RPi"]), lin_debug, inet_debug)
+
+
+# send the debug output of the LIN and INET loggers to /dev/null, so debug logging
+# can be benchmarked without flooding the console
+def mute_debug_log():
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter('%(asctime)s [%(name)s] %(levelname)s: %(message)s'))
+    for name in ("lin", "inetboxapp"):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.propagate = False
+
+
+# recorded CPplus traffic of one cycle: 0x18 polls, heartbeat and the status buffer downloads
+# with the 0x3D polls for the answers of the inetbox
+def cpplus_session():
+    d8 = bytes.fromhex("00 55 d8")
+    poll_3d = bytes.fromhex("00 55 7d")
+    frames = [d8, d8, bytes.fromhex("00 55 3c 03 05 b9 00 1f 00 00 ff 1f"), poll_3d]
+    for buf_id, data in STATUS_BUFFERS:
+        frames += buffer_download(buf_id, data)
+        frames += [poll_3d, d8, d8]
+    return frames
+
+
+def report(name, value, unit):
+    print(f"{name:<48} {value:>14.3f} {unit}")
+
+
+# in-memory serial port: bytes for the receiver are added with feed(),
+# written bytes are collected in tx (or handed to on_write)
+class MemorySerial:
+
+    def __init__(self, on_write=None):
+        self.rx = bytearray()
+        self.tx = []
+        self.on_write = on_write
+
+    @property
+    def in_waiting(self):
+        return len(self.rx)
+
+    def feed(self, data):
+        self.rx += data
+
+    def read(self, n=1):
+        data = bytes(self.rx[:n])
+        del self.rx[:n]
+        return data
+
+    def write(self, data):
+        if self.on_write:
+            self.on_write(data)
+        else:
+            self.tx.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+# connected MQTTClient of lib/mqtt_async2 for a broker on localhost
+async def mqtt_client(port, **config):
+    from mqtt_async2 import MQTTClient, MQTTConfig
+    cfg = MQTTConfig()
+    cfg.server = "127.0.0.1"
+    cfg.port = port
+    for key, value in config.items():
+        cfg[key] = value
+    client = MQTTClient(cfg)
+    await client.connect()
+    return client
+
+
+# published keys of a full status snapshot, as main.main sends it after the CPplus session
+def status_snapshot():
+    from inetboxapp import InetboxApp
+    app = InetboxApp(False)
+    for buf_id, data in STATUS_BUFFERS:
+        app.process_status_buffer_update(buf_id, data)
+    return app.get_all(True)
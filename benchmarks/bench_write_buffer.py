@@ -0,0 +1,100 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Build the upload frames of both write buffers with InetboxApp and with the former two-pass
+# encoder on random status values: the frames are compared byte by byte, then both are timed
+#
+
+import sys
+import random
+import timeit
+import bench_util
+from tools import calculate_checksum
+from inetboxapp import InetboxApp
+
+ROUNDS = 20000
+STATUSES = 200
+
+
+# former implementation of InetboxApp._get_status_buffer_for_writing / _get_status_buffer1_for_writing
+def two_pass(buf_id, status):
+    status_buffer_map = InetboxApp.STATUS_BUFFER_TYPES[buf_id]
+    status["command_counter"] = [(status["command_counter"][0] + 1) % 0xFF, True]
+    status["checksum"] = [0, True, False]
+    keys = list(status_buffer_map.keys())
+    keys.sort()
+    binary_buffer_contents = bytearray(0)
+    for key in keys:
+        map_key = status_buffer_map[key][2]
+        val = status_buffer_map[key][1]
+        if (map_key == ""):
+            binary_buffer_contents += (0).to_bytes(val, "little")
+        else:
+            binary_buffer_contents += status[map_key][0].to_bytes(val, "little")
+            status[map_key] = [status[map_key][0], status[map_key][1], False]
+    status["checksum"] = [calculate_checksum(
+        (InetboxApp.STATUS_BUFFER_PREAMBLE + buf_id + binary_buffer_contents)[InetboxApp.STATUS_HEADER_CHECKSUM_START:]
+    ), True, False]
+    binary_buffer_contents = bytearray(0)
+    for key in keys:
+        map_key = status_buffer_map[key][2]
+        val = status_buffer_map[key][1]
+        if (map_key == ""):
+            binary_buffer_contents += (0).to_bytes(val, "little")
+        else:
+            binary_buffer_contents += status[map_key][0].to_bytes(val, "little")
+    send_buffer = InetboxApp.STATUS_BUFFER_PREAMBLE + buf_id + binary_buffer_contents
+    s = [bytearray([0x03, 0x10, 0x29, 0xFA, 0x00, 0x1F, 0x00, 0x1E])]
+    for i in range(6):
+        s.append(bytearray([0x03, 0x21 + i]) + send_buffer[i * 6:i * 6 + 6])
+    for q in s:
+        q.append(calculate_checksum(q))
+    return s
+
+
+def encoder(app, buf_id):
+    return app._encode_status_buffer(buf_id)
+
+
+WRITE_BUFFERS = (InetboxApp.STATUS_BUFFER_HEADER_WRITE_STATUS, InetboxApp.STATUS_BUFFER_HEADER_WRITE_02_STATUS)
+
+
+# random values of the right size for every field of the write layouts
+def random_status(rnd):
+    status = {}
+    for buf_id in WRITE_BUFFERS:
+        for field in InetboxApp.STATUS_BUFFER_TYPES[buf_id].values():
+            if field[2]:
+                status[field[2]] = [rnd.getrandbits(8 * field[1]), True, False]
+    return status
+
+
+def main():
+    bench_util.mute_debug_log()
+    rnd = random.Random(0)
+    app = InetboxApp(False)
+    for _ in range(STATUSES):
+        status = random_status(rnd)
+        for buf_id in WRITE_BUFFERS:
+            app.status = {k: list(v) for k, v in status.items()}
+            reference = {k: list(v) for k, v in status.items()}
+            frames = [bytes(q) for q in encoder(app, buf_id)]
+            expected = [bytes(q) for q in two_pass(buf_id, reference)]
+            # the mqtt flags are taken by commit_status(), only the values and the cpplus flags are compared
+            if frames != expected or {k: (v[0], v[2]) for k, v in app.status.items()} != {k: (v[0], v[2]) for k, v in reference.items()}:
+                print(f"frame mismatch for {buf_id.hex(' ')}: {[q.hex(' ') for q in frames]}")
+                return 1
+    print(f"{STATUSES * len(WRITE_BUFFERS)} write buffers: frames identical")
+    status = random_status(rnd)
+    app.status = status
+    for buf_id in WRITE_BUFFERS:
+        t = timeit.timeit(lambda: two_pass(buf_id, status), number=ROUNDS)
+        bench_util.report(f"two-pass encoder {buf_id.hex(' ')}", t / ROUNDS * 1e6, "us/buffer")
+        t = timeit.timeit(lambda: encoder(app, buf_id), number=ROUNDS)
+        bench_util.report(f"struct encoder {buf_id.hex(' ')}", t / ROUNDS * 1e6, "us/buffer")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# In-process stand-in MQTT broker for the benchmarks: speaks the MQTT 3.1.1 subset used by
+# mqtt_async2 (CONNECT, PUBLISH QoS 0/1, SUBSCRIBE, PINGREQ, DISCONNECT). It does not route
+# messages, it only acknowledges and counts them.
+#
+# latency delays every answer of the broker (e.g. 0.005 for a broker on the LAN), so the
+# round trips of a remote broker can be simulated. With an ssl.SSLContext the broker listens
+# for TLS connections.
+#
+
+import asyncio
+import struct
+
+
+class StandInBroker:
+
+    def __init__(self, latency=0.0, ssl=None):
+        self.latency = latency
+        self.ssl = ssl
+        self.server = None
+        self.port = 0
+        self.writers = []
+        self.received = 0     # PUBLISH packets received
+        self.duplicates = 0   # PUBLISH packets received with the dup flag
+        self.writes = 0       # socket reads with at least one PUBLISH packet
+        self.last = {}        # last payload per topic
+        self.on_publish = None # called with topic and payload of every PUBLISH packet
+
+    # start listening, on a free port or on the port of a previous run
+    async def start(self, port=0):
+        self.server = await asyncio.start_server(self._client, "127.0.0.1", port, ssl=self.ssl)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.drop()
+        self.server.close()
+        await self.server.wait_closed()
+
+    # close all client connections, e.g. to test the reconnect of the client
+    def drop(self):
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    def _answer(self, writer, data):
+        if self.latency:
+            asyncio.get_running_loop().call_later(self.latency, self._write, writer, data)
+        else:
+            self._write(writer, data)
+
+    def _write(self, writer, data):
+        if not writer.is_closing():
+            writer.write(data)
+
+    async def _client(self, reader, writer):
+        self.writers.append(writer)
+        buf = bytearray()
+        try:
+            while True:
+                got = await reader.read(65536)
+                if not got:
+                    break
+                buf += got
+                if not self._process(buf, writer):
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if writer in self.writers:
+                self.writers.remove(writer)
+            writer.close()
+
+    # handles all complete packets in buf, returns False on DISCONNECT
+    def _process(self, buf, writer):
+        published = False
+        pos = 0
+        while True:
+            # fixed header: packet type and varint remaining length
+            if len(buf) - pos < 2:
+                break
+            op = buf[pos]
+            n = 0
+            sh = 0
+            i = pos + 1
+            while i < len(buf):
+                n |= (buf[i] & 0x7F) << sh
+                sh += 7
+                i += 1
+                if not buf[i - 1] & 0x80:
+                    break
+            else:
+                break
+            if len(buf) - i < n:
+                break
+            body = bytes(buf[i:i + n])
+            pos = i + n
+            kind = op & 0xF0
+            if kind == 0x10:    # CONNECT
+                self._answer(writer, b"\x20\x02\x00\x00")
+            elif kind == 0x30:  # PUBLISH
+                published = True
+                self.received += 1
+                if op & 0x08:
+                    self.duplicates += 1
+                topic_len = struct.unpack_from("!H", body)[0]
+                topic = body[2:2 + topic_len]
+                payload_pos = 2 + topic_len
+                if op & 0x06:
+                    pid = body[payload_pos:payload_pos + 2]
+                    payload_pos += 2
+                    self._answer(writer, b"\x40\x02" + pid)
+                self.last[topic] = body[payload_pos:]
+                if self.on_publish:
+                    self.on_publish(topic, self.last[topic])
+            elif kind == 0x80:  # SUBSCRIBE
+                self._answer(writer, b"\x90\x03" + body[:2] + bytes([body[-1]]))
+            elif kind == 0xC0:  # PINGREQ
+                self._answer(writer, b"\xd0\x00")
+            elif kind == 0xE0:  # DISCONNECT
+                return False
+        del buf[:pos]
+        if published:
+            self.writes += 1
+        return True
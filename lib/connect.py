@@ -14,6 +14,7 @@ import sys
 import logging
 import configparser
 from mqtt_async2 import MQTTClient, MQTTConfig
+from offline_store import OfflineStore
 from tools import PIN_MAPS, PIN_MAP
 
 log = logging.getLogger(__name__)
@@ -101,11 +102,28 @@ class Connect():
             self.mqtt_config.server   = cfg["mqtt"]["server"]
             self.mqtt_config.user     = cfg["mqtt"]["user"]
             self.mqtt_config.password = cfg["mqtt"]["password"]
-            port = 1883
+            if cfg.getboolean("mqtt", "tls", fallback=False):
+                self.mqtt_config.ssl_params = {
+                    "ca_certs": cfg.get("mqtt", "ca_certs", fallback="") or None,
+                    "certfile": cfg.get("mqtt", "certfile", fallback="") or None,
+                    "keyfile":  cfg.get("mqtt", "keyfile", fallback="") or None,
+                }
+                log.info("MQTT over TLS")
+            # without a port, MQTTClient uses 1883 or 8883 for TLS
             if cfg["mqtt"]["port"] != "":
                 port = int(cfg["mqtt"]["port"])
+                self.mqtt_config.port = port
                 log.info(f"MQTT Port is switched to port: {port}")
             self.mqtt_config.clean     = True
+            self.mqtt_config.max_inflight = cfg.getint("mqtt", "max_inflight", fallback=self.mqtt_config.max_inflight)
+            self.mqtt_config.queue_size   = cfg.getint("mqtt", "queue_size", fallback=self.mqtt_config.queue_size)
+            offline_dir = cfg.get("mqtt", "offline_dir", fallback="")
+            if offline_dir != "":
+                try:
+                    self.mqtt_config.offline_store = OfflineStore(offline_dir)
+                    log.info(f"MQTT offline store: {offline_dir}")
+                except OSError as e:
+                    log.error(f"Failed to open MQTT offline store: {e}")
             self.mqtt_config.keepalive = 60  # last will after 60sec off
             self.mqtt_config.set_last_will("service/truma/control_status/alive", "OFF", retain=True, qos=0)  # last will is important
             self.client = MQTTClient(self.mqtt_config, mqtt_debug)
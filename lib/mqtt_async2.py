@@ -16,7 +16,7 @@
 
 VERSION = (0, 7, 4) # modified in Line 678 / 690 by mc
 
-import socket, struct
+import socket, struct, ssl
 from binascii import hexlify
 from errno import EINPROGRESS
 from sys import platform
@@ -24,6 +24,7 @@ from time import monotonic
 import asyncio
 import uuid
 import logging
+from collections import deque
 import inspect
 
 
@@ -56,6 +57,14 @@ CONN_CLOSED = "Connection closed"
 CONN_TIMEOUT = "Connection timed out"
 PROTO_ERROR = "Protocol error"
 
+# Topics with their 16-bit length prefix, as they go into PUBLISH packets. The set of topics an
+# application publishes to is small and fixed, the cache is only flushed if it grows beyond size.
+_topic_cache = {}
+_TOPIC_CACHE_SIZE = 256
+
+# Single bytes for the fixed header of PUBLISH packets (packet type and short lengths)
+_BYTES = tuple(bytes([i]) for i in range(256))
+
 class AsyncSock:
     def __init__(self, reader, writer):
         self.reader = reader
@@ -76,12 +85,47 @@ class AsyncSock:
     async def wait_closed(self):
         await self.writer.wait_closed()
 
+    # tls_object returns the ssl.SSLObject of a TLS connection, None for plain TCP
+    def tls_object(self):
+        return self.writer.get_extra_info("ssl_object")
+
 
-async def open_connection(addr):
-    reader, writer = await asyncio.open_connection(addr[0], addr[1])
+async def open_connection(addr, ssl_ctx=None, server_hostname=None):
+    reader, writer = await asyncio.open_connection(addr[0], addr[1], ssl=ssl_ctx,
+            server_hostname=server_hostname if ssl_ctx is not None else None)
     return AsyncSock(reader, writer)
 
 
+# TLSContext is an ssl.SSLContext for connecting to the broker, that resumes the TLS session of the
+# previous connection: asyncio creates the SSLObject of a connection through wrap_bio(), which
+# gets the session saved by MQTTProto.connect(). A reconnect then skips the full handshake if the
+# broker still knows the session, otherwise a full handshake is done.
+class TLSContext(ssl.SSLContext):
+    session = None
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.session
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
+# tls_context creates the TLSContext for the ssl_params of MQTTConfig: ca_certs is the CA file for
+# verifying the broker (system CAs if None), certfile and keyfile the optional client certificate.
+# verify=False disables the verification of the broker certificate (for testing only).
+def tls_context(ca_certs=None, certfile=None, keyfile=None, verify=True):
+    ctx = TLSContext(ssl.PROTOCOL_TLS_CLIENT)
+    if ca_certs:
+        ctx.load_verify_locations(ca_certs)
+    else:
+        ctx.load_default_certs()
+    if certfile:
+        ctx.load_cert_chain(certfile, keyfile)
+    if not verify:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
 def is_awaitable(f):
     return inspect.isawaitable(f)
 
@@ -105,7 +149,7 @@ class MQTTConfig:
         self.password        = b''
         self.response_time   = 10  # in seconds
         self.keepalive       = 600 # in seconds, only sent if self.will != None
-        self.ssl_params      = None
+        self.ssl_params      = None             # TLS: dict of tls_context() args or an ssl.SSLContext
         self.interface       = None
         self.clean           = True
         self.will            = None             # last will message, must be MQTTMessage
@@ -114,6 +158,9 @@ class MQTTConfig:
         self.connect_coro    = None             # notification when a MQTT connection starts
         self.ssid            = None
         self.wifi_pw         = None
+        self.max_inflight    = 16               # unacked QoS=1 messages on the wire
+        self.queue_size      = 64               # messages waiting for a slot in the in-flight window
+        self.offline_store   = None             # store for pubs while disconnected, see offline_store.py
         # The following are not currently supported:
         #self.sock_cb         = None             # callback for esp32 socket to allow bg operation
         #self.listen_interval = 0                # Wifi listen interval for power save
@@ -174,6 +221,9 @@ class MQTTProto:
         self._sock = None
         self._lock = asyncio.Lock()
         self.last_ack = 0 # last ACK received from broker
+        # receive buffer with read cursor, see _fill()
+        self._read_buf = bytearray()
+        self._read_pos = 0
 
     # connect initiates a connection to the broker at addr.
     # Addr should be the result of a gethostbyname (typ. an ip-address and port tuple).
@@ -181,8 +231,11 @@ class MQTTProto:
     # Connect waits for the connection to get established and for the broker to ACK the connect packet.
     # It raises an OSError if the connection cannot be made.
     # Reusing an MQTTProto for a second connection is not recommended.
+    # With ssl_params (an ssl.SSLContext) the connection uses TLS, server_hostname is the name
+    # the broker certificate is checked against. A TLSContext gets the session of the connection
+    # for resuming it on the next one.
     async def connect(self, addr, client_id, clean, user=None, pwd=None, ssl_params=None,
-            keepalive=0, lw=None):
+            keepalive=0, lw=None, server_hostname=None):
         if lw is None:
             keepalive = 0
         log.info('Connecting to %s id=%s clean=%d', addr, client_id, clean)
@@ -190,18 +243,13 @@ class MQTTProto:
             # in principle, open_connection returns a (reader,writer) stream tuple, but in MP it
             # really returns a bidirectional stream twice, so we cheat and use only one of the tuple
             # values for everything.
-            self._sock = await open_connection(addr)
+            self._sock = await open_connection(addr, ssl_params, server_hostname)
         except OSError as e:
             if e.args[0] != EINPROGRESS:
                 raise
         await asyncio.sleep(0.01) # sure sure this is needed...
         #if self._sock_cb is not None: # st socket event for mqrepl's use
         #    self._sock.setsockopt(socket.SOL_SOCKET, 20, self._sock_cb)
-        assert ssl_params is None, "TLS not yet supported" # :-(
-        #if ssl_params is not None:
-        #    log.debug("Wrapping SSL")
-        #    import ssl
-        #    self._sock = ssl.wrap_socket(self._sock, **ssl_params)
         # Construct connect packet
         premsg = bytearray(b"\x10\0\0\0\0")   # Connect message header
         msg = bytearray(b"\0\x04MQTT\x04\0\0\0")  # Protocol 3.1.1
@@ -240,37 +288,58 @@ class MQTTProto:
         if resp[3] != 0 or resp[0] != 0x20 or resp[1] != 0x02:
             raise OSError(-1)  # Bad CONNACK e.g. authentication fail.
         self.last_ack = ticks_ms()
+        # the broker has sent its session ticket before the CONNACK
+        tls = self._sock.tls_object() if ssl_params is not None else None
+        if tls is not None:
+            log.debug('TLS %s session reused=%s', tls.version(), tls.session_reused)
+            if isinstance(ssl_params, TLSContext):
+                ssl_params.session = tls.session
         log.debug('Connected')  # Got CONNACK
 
     # ===== Helpers
 
+    # _fill reads from the socket in a blocking manner using asyncio until at least n unread bytes
+    # are in the receive buffer. On error *and on EOF* it raises an OSError.
+    # There is no time-out, instead, _fill relies on the socket being closed by a watchdog.
+    # The receive buffer is a bytearray with a read cursor (_read_pos), so consuming bytes doesn't
+    # copy the rest of the buffer. The consumed bytes are dropped when the buffer has been drained,
+    # or before new data is appended if they take up more than _READ_SIZE bytes.
+    # _fill reads a bunch of bytes at once because calling self.sock._read takes 4-5ms minumum and
+    # read_msg needs a good number of very short reads.
+    async def _fill(self, n):
+        buf = self._read_buf
+        while len(buf) - self._read_pos < n:
+            if self._sock is None:
+                raise OSError(-1, CONN_CLOSED)
+            if self._read_pos == len(buf):
+                buf.clear()
+                self._read_pos = 0
+            elif self._read_pos >= self._READ_SIZE:
+                del buf[:self._read_pos]
+                self._read_pos = 0
+            missing = n - (len(buf) - self._read_pos)
+            got = await self._sock.read(max(missing, self._READ_SIZE))
+            if len(got) == 0:
+                raise OSError(-1, CONN_CLOSED)
+            buf += got
+    _READ_SIZE = 4096
+
     # _as_read reads n bytes from the socket in a blocking manner using asyncio and returns them as
     # bytes. On error *and on EOF* it raises an OSError.
-    # There is no time-out, instead, as_read relies on the socket being closed by a watchdog.
-    # _as_read buffers a bunch of bytes because calling self.sock._read takes 4-5ms minumum and
-    # _read_msg does a good number of very short reads.
     async def _as_read(self, n):
-        # Note: uasyncio.Stream.read returns short reads
-        #t0 = ticks_ms()
-        while self._sock:
-            # read missing amt
-            missing = n - len(self._read_buf)
-            if missing > 0:
-                if missing < 128:
-                    missing = 128
-                got = await self._sock.read(missing)
-                if len(got) == 0:
-                    raise OSError(-1, CONN_CLOSED)
-                self._read_buf += got
-                missing = n - len(self._read_buf)
-            # got enough?
-            if missing <= 0:
-                res = self._read_buf[:n]
-                self._read_buf = self._read_buf[n:]
-                #print("rd", len(res), "in", ticks_diff(ticks_ms(), t0))
-                return res
-        raise OSError(-1, CONN_CLOSED)
-    _read_buf = b''
+        if len(self._read_buf) - self._read_pos < n:
+            await self._fill(n)
+        pos = self._read_pos
+        self._read_pos = pos + n
+        return bytes(memoryview(self._read_buf)[pos:pos+n])
+
+    # _read_byte reads a single byte from the socket and returns it as int
+    async def _read_byte(self):
+        if self._read_pos >= len(self._read_buf):
+            await self._fill(1)
+        b = self._read_buf[self._read_pos]
+        self._read_pos += 1
+        return b
 
     # _as_write writes n bytes to the socket in a blocking manner using asyncio. On error or EOF
     # it raises an OSError.
@@ -294,8 +363,7 @@ class MQTTProto:
         n = 0
         sh = 0
         while 1:
-            res = await self._as_read(1)
-            b = res[0]
+            b = await self._read_byte()
             n |= (b & 0x7f) << sh
             if not b & 0x80:
                 return n
@@ -337,42 +405,56 @@ class MQTTProto:
 
     def isconnected(self): self._sock is not None
 
-    # publish writes a publish message onto the current socket. It raises an OSError on failure.
-    # If qos==1 then a pid must be provided.
+    # _topic_prefix returns the topic with its 16-bit length prefix from the topic cache
+    def _topic_prefix(self, topic):
+        if not isinstance(topic, bytes):
+            topic = bytes(topic)
+        t = _topic_cache.get(topic)
+        if t is None:
+            if len(_topic_cache) >= _TOPIC_CACHE_SIZE:
+                _topic_cache.clear()
+            t = _topic_cache[topic] = struct.pack("!H", len(topic)) + topic
+        return t
+
+    # _publish_parts appends the parts of a publish packet to the list parts: the fixed header, the
+    # cached topic, the pid and the message. Joining the parts of a batch copies every byte once,
+    # so building a packet comes down to copying the message into place.
     # msg.topic and msg.message must be byte arrays, or equiv.
-    async def publish(self, msg, dup=0):
-        # calculate message length
-        mlen = len(msg.message)
-        sz = 2 + len(msg.topic) + mlen
+    def _publish_parts(self, parts, msg, dup=0):
+        topic = self._topic_prefix(msg.topic)
+        sz = len(topic) + len(msg.message)
         if msg.qos > 0:
             sz += 2 # account for pid
         if sz >= 2097152:
             raise ValueError('message too long')
-        # construct packet: if possible, put everything into a single large bytearray so a single
-        # socket send call can be made resulting in a single packet.
-        hdrlen = 4+2+len(msg.topic)+2
-        single = hdrlen + mlen <= 1440 # slightly conservative MSS
-        if single:
-            pkt = bytearray(hdrlen+mlen)
+        parts.append(_BYTES[0x30 | msg.qos << 1 | msg.retain | dup << 3])
+        if sz < 0x80:
+            parts.append(_BYTES[sz])
         else:
-            pkt = bytearray(hdrlen)
-        pkt[0] = 0x30 | msg.qos << 1 | msg.retain | dup << 3
-        l = self._write_varint(pkt, 1, sz)
-        struct.pack_into("!H", pkt, l, len(msg.topic))
-        l += 2
-        pkt[l:l+len(msg.topic)] = msg.topic
-        l += len(msg.topic)
+            hdr = bytearray(3)
+            parts.append(hdr[:self._write_varint(hdr, 0, sz)])
+        parts.append(topic)
         if msg.qos > 0:
-            struct.pack_into("!H", pkt, l, msg.pid)
-            l += 2
-        # send header and body
+            parts.append(msg.pid.to_bytes(2, "big"))
+        parts.append(msg.message)
+
+    # publish writes a publish message onto the current socket. It raises an OSError on failure.
+    # If qos==1 then a pid must be provided.
+    # msg.topic and msg.message must be byte arrays, or equiv.
+    async def publish(self, msg, dup=0):
+        parts = []
+        self._publish_parts(parts, msg, dup)
         async with self._lock:
-            if single:
-                pkt[l:] = msg.message
-                await self._as_write(pkt)
-            else:
-                await self._as_write(pkt[:l])
-                await self._as_write(msg.message)
+            await self._as_write(b"".join(parts))
+
+    # publish_many writes a batch of publish messages onto the current socket with a single write.
+    # It raises an OSError on failure. Messages with qos==1 must carry a pid.
+    async def publish_many(self, msgs, dup=0):
+        parts = []
+        for msg in msgs:
+            self._publish_parts(parts, msg, dup)
+        async with self._lock:
+            await self._as_write(b"".join(parts))
 
     # subscribe sends a subscription message.
     async def subscribe(self, topic, qos, pid):
@@ -392,44 +474,53 @@ class MQTTProto:
     # Called from ._handle_msg().
     async def read_msg(self):
         #t0 = ticks_ms()
-        res = await self._as_read(1)
+        # The fixed headers and the packets are parsed straight out of the receive buffer
+        buf = self._read_buf
+        op = await self._read_byte()
         # We got something, dispatch based on message type
-        op = res[0]
         if op == 0xd0:  # PINGRESP
-            await self._as_read(1)
+            await self._read_byte()
             self.last_ack = ticks_ms()
             self._pingresp_cb()
         elif op == 0x40:  # PUBACK: remove pid from unacked_pids
-            sz = await self._as_read(1)
-            if sz != b"\x02":
-                raise OSError(-1, PROTO_ERROR, "puback", sz)
-            rcv_pid = await self._as_read(2)
-            pid = rcv_pid[0] << 8 | rcv_pid[1]
+            if len(buf) - self._read_pos < 3:
+                await self._fill(3)
+            pos = self._read_pos
+            if buf[pos] != 0x02:
+                raise OSError(-1, PROTO_ERROR, "puback", bytes(buf[pos:pos+1]))
+            pid = buf[pos+1] << 8 | buf[pos+2]
+            self._read_pos = pos + 3
             self.last_ack = ticks_ms()
             self._puback_cb(pid)
         elif op == 0x90:  # SUBACK: flag pending subscribe to end
-            resp = await self._as_read(4)
-            pid = resp[2] | (resp[1] << 8)
-            #print("suback", resp[3])
+            if len(buf) - self._read_pos < 4:
+                await self._fill(4)
+            pos = self._read_pos
+            pid = buf[pos+2] | (buf[pos+1] << 8)
+            actual_qos = buf[pos+3]
+            self._read_pos = pos + 4
+            #print("suback", actual_qos)
             self.last_ack = ticks_ms()
-            self._suback_cb(pid, resp[3])
+            self._suback_cb(pid, actual_qos)
         elif (op & 0xf0) == 0x30:  # PUB: dispatch to user handler
             sz = await self._read_varint()
-            topic_len = await self._as_read(2)
-            topic_len = (topic_len[0] << 8) | topic_len[1]
-            topic = await self._as_read(topic_len)
-            sz -= topic_len + 2
+            if len(buf) - self._read_pos < sz:
+                await self._fill(sz)
+            pos = self._read_pos
             retained = op & 0x01
             qos = (op>>1) & 3
+            hdr = 4 if qos else 2 # topic length and pid
+            topic_len = buf[pos] << 8 | buf[pos+1] if sz >= 2 else 0
+            if sz - hdr - topic_len < 0:
+                raise OSError(-1, PROTO_ERROR, "pub sz", sz - hdr - topic_len)
+            mv = memoryview(buf)
+            topic = bytes(mv[pos+2:pos+2+topic_len])
             pid = None
             if qos: # not QoS=0 -> got pid
-                pid = await self._as_read(2)
-                pid = pid[0] << 8 | pid[1]
-                sz -= 2
-            if sz < 0:
-                raise OSError(-1, PROTO_ERROR, "pub sz", sz)
-            else:
-                msg = await self._as_read(sz)
+                pid = buf[pos+2+topic_len] << 8 | buf[pos+3+topic_len]
+            msg = bytes(mv[pos+hdr+topic_len:pos+sz])
+            mv.release()
+            self._read_pos = pos + sz
             # Dispatch to user's callback handler
             log.debug("dispatch pub %s pid=%s qos=%d", topic, pid, qos)
             #t1 = ticks_ms()
@@ -471,6 +562,10 @@ class MQTTClient():
             raise ValueError('invalid keepalive')
         if self._c.keepalive > 0 and self._c.keepalive < self._c.response_time * 2:
             raise ValueError("keepalive <2x response_time")
+        # TLS context, kept for the life of the client so reconnects can resume the TLS session
+        self._ssl = config.ssl_params
+        if isinstance(self._ssl, dict):
+            self._ssl = tls_context(**self._ssl)
         # config server and port
         if config.port == 0:
             self._c.port = 8883 if config.ssl_params else 1883
@@ -484,8 +579,13 @@ class MQTTClient():
         self._unacked_pids = {}     # PUBACK and SUBACK pids awaiting ACK response
         self._state = 0             # 0=init, 1=has-connected, 2=disconnected=dead
         self._conn_keeper = None    # handle to persistent keep-connection coro
-        self._prev_pub = None       # MQTTMessage of as yet unacked async pub
-        self._prev_pub_proto = None # self._proto used for as yet unacked async pub
+        self._outq = deque()        # (MQTTMessage, future) waiting to be sent
+        self._inflight = {}         # pid -> [MQTTMessage, future, time sent] of unacked pubs, in send order
+        self._send_ev = None        # set when the sender has something to do, see _events()
+        self._queue_space = None    # set when the sender took messages from the queue
+        self._store = config.offline_store  # pubs while disconnected, None: pubs wait in the queue
+        if self._c.max_inflight < 1 or self._c.queue_size < 1:
+            raise ValueError('invalid max_inflight or queue_size')
         # misc
         if platform == "esp8266":
             import esp
@@ -508,6 +608,7 @@ class MQTTClient():
     async def connect(self):
         if self._state > 1:
             raise ValueError("cannot reuse")
+        self._events()
         clean = False
         # deal with wifi and dns
         #if not self._c.interface.isconnected():
@@ -520,9 +621,9 @@ class MQTTClient():
                 self._got_pingresp)
         # FIXME: need to use a timeout here!
         await proto.connect(self._addr, self._c.client_id, clean,
-                user=self._c.user, pwd=self._c.password, ssl_params=self._c.ssl_params,
+                user=self._c.user, pwd=self._c.password, ssl_params=self._ssl,
                 keepalive=self._c.keepalive,
-                lw=self._c.will) # raises on error
+                lw=self._c.will, server_hostname=self._c.server) # raises on error
         self._proto = proto
         # update state
         if self._state == 0:
@@ -544,16 +645,34 @@ class MQTTClient():
         # Start background coroutines that quit on connection fail
         asyncio.create_task(self._handle_msgs(self._proto))
         asyncio.create_task(self._keep_alive(self._proto))
+        asyncio.create_task(self._send_queue(self._proto))
         # Notify app that we're connceted and ready to roll
         if self._c.connect_coro is not None:
             asyncio.create_task(self._c.connect_coro(self))
         log.debug("connected")
 
+    # the events are created in the running loop: before Python 3.10, asyncio objects are bound
+    # to the loop of the thread when created, which isn't the one of asyncio.run()
+    def _events(self):
+        if self._send_ev is None:
+            self._send_ev = asyncio.Event()
+            self._queue_space = asyncio.Event()
+
     async def disconnect(self):
+        self._events()
         self._state = 2 # dead - do not reconnect
         if self._proto is not None:
             await self._proto.disconnect() # should we do a create_task here?
         self._proto = None
+        # nothing will be sent anymore, fail the futures of the pending pubs
+        pending = [fut for _, fut in self._outq] + [v[1] for v in self._inflight.values()]
+        self._outq.clear()
+        self._inflight.clear()
+        for fut in pending:
+            if not fut.done():
+                fut.set_exception(OSError(-1, CONN_CLOSED))
+        self._send_ev.set()
+        self._queue_space.set()
 
     #===== Manage PIDs and ACKs
     # self._unacked_pids is a hash that contains unacked pids. Each hash value is a list, the first
@@ -567,7 +686,12 @@ class MQTTClient():
 
     # _got_puback handles a puback by removing the pid from those we're waiting for
     def _got_puback(self, pid):
-        if pid in self._unacked_pids:
+        if pid in self._inflight:
+            fut = self._inflight.pop(pid)[1]
+            if not fut.done():
+                fut.set_result(None)
+            self._send_ev.set() # a slot in the in-flight window became free
+        elif pid in self._unacked_pids:
             self._unacked_pids[pid][0].set()
 
     def _got_pingresp(self): self._got_puback(PING_PID)
@@ -630,6 +754,83 @@ class MQTTClient():
         except Exception as e:
             await self._reconnect(proto, 'keepalive')
 
+    # Launched by connect. Runs until connectivity fails. Sends the queued pubs as long as there is
+    # room in the in-flight window, batching everything that is ready into a single socket write.
+    # The pubs left unacked by the previous connection are retransmitted first, in their original
+    # order. If the oldest unacked pub is not ACKed within the response time, the connection is
+    # deemed broken.
+    async def _send_queue(self, proto):
+        rt = self._c.response_time
+        try:
+            if self._store is not None and self._store.pending():
+                self._drain_store()
+            if self._inflight:
+                msgs = []
+                for v in self._inflight.values():
+                    msgs.append(v[0])
+                    v[2] = monotonic()
+                log.warning("repub %d unacked messages", len(msgs))
+                await proto.publish_many(msgs, dup=1)
+            while self._proto is proto:
+                self._send_ev.clear()
+                batch = []
+                sent_qos0 = []
+                while self._outq and len(self._inflight) < self._c.max_inflight:
+                    message, fut = self._outq.popleft()
+                    batch.append(message)
+                    if message.qos:
+                        self._inflight[message.pid] = [message, fut, monotonic()]
+                    else:
+                        sent_qos0.append((message, fut))
+                if batch:
+                    self._queue_space.set()
+                    log.debug("pub batch of %d, %d in flight", len(batch), len(self._inflight))
+                    try:
+                        await proto.publish_many(batch)
+                    except OSError:
+                        # QoS=0 messages are not retransmitted, put them back into the queue
+                        self._outq.extendleft(reversed(sent_qos0))
+                        raise
+                    for _, fut in sent_qos0:
+                        if not fut.done():
+                            fut.set_result(None)
+                    continue
+                # wait for ACKs or new pubs, but not beyond the deadline of the oldest unacked pub
+                timeout = None
+                if self._inflight:
+                    timeout = next(iter(self._inflight.values()))[2] + rt - monotonic()
+                    if timeout <= 0:
+                        raise OSError(-1, CONN_TIMEOUT)
+                try:
+                    await asyncio.wait_for(self._send_ev.wait(), timeout)
+                except asyncio.TimeoutError:
+                    raise OSError(-1, CONN_TIMEOUT)
+        except OSError as e:
+            await self._reconnect(proto, 'pub', e)
+
+    # _drain_store queues the pubs of the offline store behind the pubs that were queued before the
+    # connection broke. The store releases them once the broker has ACKed all of them, if the client
+    # gets disconnected before, the next drain sends them again.
+    def _drain_store(self):
+        msgs, mark = self._store.take()
+        log.info("sending %d messages from offline store", len(msgs))
+        loop = asyncio.get_running_loop()
+        futs = []
+        for topic, msg, retain, qos in msgs:
+            pid = self._newpid() if qos else None
+            fut = loop.create_future()
+            self._outq.append((MQTTMessage(topic, msg, retain, qos, pid), fut))
+            futs.append(fut)
+        asyncio.create_task(self._release_store(futs, mark))
+
+    async def _release_store(self, futs, mark):
+        try:
+            await asyncio.gather(*futs)
+        except OSError:
+            self._store.rewind() # disconnected, the messages stay in the store
+            return
+        self._store.release(mark)
+
     # _reconnect schedules a reconnection if not underway.
     # the proto passed in must be the one that caused the error in order to avoid closing a newly
     # connected proto when _reconnect gets called multiple times for one failure.
@@ -690,68 +891,44 @@ class MQTTClient():
                     raise OSError(-1, "subscribe failed: " + e.args[1])
             await self._reconnect(proto, 'sub')
 
-    # publish with support for async, meaning that the packet is published but an ack (if qos 1) is
-    # not awaited. Instead the ack is awaited after the next packet is published.
-    # Algorithm:
-    # 1. If prev packet was async:
-    #   a. if got ACK go to step 2
-    #   b. if still on same socket, go to step 2
-    #   c. (no ACK and new socket) retransmit prev packet
-    # 2. Transmit new packet
-    # 3. If prev packet was async:
-    #   a. wait for ACK with timeout, if got ACK go to step 4
-    #   b. reconnect, retransmit prev packet, go to step 2
-    # 3. If new packet is QoS=0 or async, return success
-    # 4. (new packet is QoS=1 and sync) wait for ACK
-    async def publish(self, topic, msg, retain=False, qos=0, sync=True):
-        dup = 0
+    # publish_async queues a pub and returns a future that resolves when the pub has been ACKed by
+    # the broker (QoS=1) or written to the socket (QoS=0). Up to config.max_inflight QoS=1 pubs are
+    # on the wire at the same time, unacked pubs are retransmitted in order after a reconnect.
+    # If config.queue_size pubs are waiting already, publish_async waits for room in the queue.
+    # The future fails with an OSError if the client gets disconnected.
+    # With config.offline_store, pubs are put into the store while there is no connection (and
+    # until the store has been drained), the future is done right away.
+    async def publish_async(self, topic, msg, retain=False, qos=0):
+        self._events()
+        if self._store is not None and self._state < 2 and (self._proto is None or self._store.pending()):
+            message = MQTTMessage(topic, msg, retain, qos)
+            self._store.put(message.topic, message.message, message.retain, message.qos)
+            fut = asyncio.get_running_loop().create_future()
+            fut.set_result(None)
+            return fut
+        while len(self._outq) >= self._c.queue_size and self._state < 2:
+            self._queue_space.clear()
+            await self._queue_space.wait()
+        if self._state > 1:
+            raise OSError(-1, CONN_CLOSED)
         pid = self._newpid() if qos else None
         message = MQTTMessage(topic, msg, retain, qos, pid)
-        if qos:
-            self._unacked_pids[pid] = [ asyncio.Event(), None ]
-        while True:
-            log.debug("pub begin for pid=%s", pid)
-            # first we need a connection
-            while self._proto is None:
-                await asyncio.sleep(_CONN_DELAY)
-            # if there is an async packet outstanding and it has not been acked, and a new connection
-            # has been established then begin by retransmitting that packet.
-            proto = self._proto
-            if self._prev_pub is not None and pid in self._unacked_pids and \
-                    self._prev_pub_proto != proto:
-                m = self._prev_pub
-                log.warning("repub->%s qos=%d pid=%d", m.topic, m.qos, m.pid)
-                self._prev_pub_proto = proto
-                try:
-                    await proto.publish(m, dup=1)
-                except OSError as e:
-                    await self._reconnect(proto, 'pub')
-                    continue
-            # now publish the new packet on the same connection
-            log.debug("pub->%s qos=%d pid=%d", message.topic, message.qos, message.pid)
-            try:
-                await proto.publish(message, dup)
-            except OSError as e:
-                await self._reconnect(proto, 'pub')
-                continue
-            # if there is an async packet outstanding wait for an ack
-            if self._prev_pub is not None:
-                try:
-                    await self._await_pid(self._prev_pub.pid)
-                except OSError as e:
-                    await self._reconnect(proto, 'pub')
-                    continue
-                self._prev_pub = None
-                self._prev_pub_proto = None
-            # new packet one becomes prev if qos>0 and async, or gotta wait for new one's ack if sync
-            if qos == 0:
-                return
-            if not sync:
-                self._prev_pub = message
-                self._prev_pub_proto = proto
-                return
-            try:
-                await self._await_pid(message.pid)
-                return
-            except OSError as e:
-                await self._reconnect(proto, 'pub')
+        fut = asyncio.get_running_loop().create_future()
+        self._outq.append((message, fut))
+        self._send_ev.set()
+        return fut
+
+    # publish queues a pub, with sync it waits until the pub has been ACKed (QoS=1) or sent (QoS=0).
+    async def publish(self, topic, msg, retain=False, qos=0, sync=True):
+        fut = await self.publish_async(topic, msg, retain, qos)
+        if sync:
+            await fut
+
+    # publish_many queues a batch of (topic, msg) pairs and waits until all of them have been
+    # ACKed (QoS=1) or sent (QoS=0). The sender writes everything that fits into the in-flight
+    # window with a single socket write.
+    async def publish_many(self, msgs, retain=False, qos=0):
+        futs = []
+        for topic, msg in msgs:
+            futs.append(await self.publish_async(topic, msg, retain, qos))
+        await asyncio.gather(*futs)
@@ -0,0 +1,172 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Disk-backed store for MQTT messages published while the broker is unreachable
+#
+# The messages are appended to segment files (segment-000001.log, ...) in a directory, each record
+# with a CRC, so a record torn by a power loss is detected when the segments are loaded again.
+# Only the latest message per topic is kept: an index in memory holds one entry per topic and the
+# segments are compacted into one when there are too many of them. This keeps memory and disk use
+# bounded during long outages, and the store survives a restart of the service.
+#
+# MQTTClient (lib/mqtt_async2.py) puts messages into the store while it is disconnected and takes
+# them out in one go when the connection is back. The segments are released once the broker has
+# acknowledged the messages; if the delivery fails, rewind() hands them out again with the next take().
+#
+
+import os
+import zlib
+import struct
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class OfflineStore:
+
+    HEADER = struct.Struct("!IBHI") # crc32, flags (qos, retain), topic length, message length
+    PREFIX = "segment-"
+    SUFFIX = ".log"
+
+    def __init__(self, directory, segment_size=65536, max_segments=8, max_topics=1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.max_topics = max_topics
+        self._index = {}     # topic -> [seq, message, retain, qos] of the latest message
+        self._seq = 0        # sequence number of the last record
+        self._handed = 0     # records up to this sequence number have been handed out by take()
+        self._taken = 0      # records up to this sequence number have been delivered and released
+        self._segments = []  # [number, seq of the last record] of the segment files, oldest first
+        self._file = None    # segment file records are appended to
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        if self._index:
+            log.info(f"{len(self._index)} messages in offline store {directory}")
+
+    def __len__(self):
+        return len(self._index)
+
+    # pending returns True if there are messages that have not been handed out by take()
+    def pending(self):
+        return self._seq > self._handed
+
+    # put stores a message, replacing the previous one of the topic
+    def put(self, topic, message, retain=False, qos=0):
+        if isinstance(topic, str): topic = topic.encode()
+        if isinstance(message, str): message = message.encode()
+        if topic not in self._index and len(self._index) >= self.max_topics:
+            log.warning(f"offline store full, dropped message for {topic}")
+            return False
+        record = self._record(topic, message, retain, qos)
+        if self._file is None or self._size + len(record) > self.segment_size:
+            self._rotate()
+        self._file.write(record)
+        self._file.flush()
+        self._size += len(record)
+        self._seq += 1
+        self._segments[-1][1] = self._seq
+        self._index[topic] = [self._seq, message, retain, qos]
+        return True
+
+    # take returns the messages put since the last take, as (topic, message, retain, qos) in the
+    # order they were put, and the mark to release them with once they have been delivered.
+    # The messages stay in the store until then.
+    def take(self):
+        records = [(v[0], topic, v[1], v[2], v[3]) for topic, v in self._index.items() if v[0] > self._handed]
+        records.sort()
+        self._handed = self._seq
+        self._close() # messages put from now on go into a new segment
+        return [r[1:] for r in records], self._handed
+
+    # rewind hands the messages that have not been released out again with the next take, for when
+    # their delivery failed
+    def rewind(self):
+        self._handed = self._taken
+
+    # release removes the messages up to mark from the store, unless they have been replaced
+    def release(self, mark):
+        self._taken = max(self._taken, mark)
+        for topic in [topic for topic, v in self._index.items() if v[0] <= mark]:
+            del self._index[topic]
+        while self._segments and self._segments[0][1] <= mark:
+            if self._file is not None and len(self._segments) == 1:
+                break # current segment
+            self._remove(self._segments.pop(0)[0])
+
+    # ===== Segment files
+
+    def _path(self, number):
+        return os.path.join(self.directory, f"{self.PREFIX}{number:06d}{self.SUFFIX}")
+
+    def _record(self, topic, message, retain, qos):
+        body = struct.pack("!BHI", qos | retain << 1, len(topic), len(message)) + topic + message
+        return struct.pack("!I", zlib.crc32(body)) + body
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _remove(self, number):
+        try:
+            os.remove(self._path(number))
+        except OSError as e:
+            log.warning(f"offline store: {e}")
+
+    # start a new segment, the segments are compacted first if there are too many
+    def _rotate(self):
+        self._close()
+        if len(self._segments) >= self.max_segments:
+            self._compact()
+        number = self._segments[-1][0] + 1 if self._segments else 1
+        self._file = open(self._path(number), "ab")
+        self._size = 0
+        self._segments.append([number, self._seq])
+
+    # write the messages of the index into a new segment and remove all older segments
+    def _compact(self):
+        number = self._segments[-1][0] + 1
+        records = sorted((v[0], topic, v[1], v[2], v[3]) for topic, v in self._index.items())
+        tmp = self._path(number) + ".tmp"
+        with open(tmp, "wb") as f:
+            for seq, topic, message, retain, qos in records:
+                f.write(self._record(topic, message, retain, qos))
+        os.replace(tmp, self._path(number))
+        for segment in self._segments:
+            self._remove(segment[0])
+        self._segments = [[number, records[-1][0] if records else self._seq]]
+        log.debug(f"offline store compacted to {len(records)} messages")
+
+    # rebuild the index from the segment files, e.g. after a restart
+    def _load(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(self.PREFIX) and name.endswith(self.SUFFIX):
+                try:
+                    numbers.append(int(name[len(self.PREFIX):-len(self.SUFFIX)]))
+                except ValueError:
+                    pass
+        numbers.sort()
+        for number in numbers:
+            with open(self._path(number), "rb") as f:
+                data = f.read()
+            pos = 0
+            seq = self._seq
+            while pos + self.HEADER.size <= len(data):
+                crc, flags, topic_len, msg_len = self.HEADER.unpack_from(data, pos)
+                end = pos + self.HEADER.size + topic_len + msg_len
+                if end > len(data) or zlib.crc32(data[pos+4:end]) != crc:
+                    break
+                topic = data[pos+self.HEADER.size:pos+self.HEADER.size+topic_len]
+                self._seq += 1
+                self._index[topic] = [self._seq, data[end-msg_len:end], bool(flags & 2), flags & 1]
+                pos = end
+            if pos < len(data):
+                log.warning(f"offline store: {len(data) - pos} bytes of damaged records in {self._path(number)}")
+            if self._seq > seq:
+                self._segments.append([number, self._seq])
+            else:
+                self._remove(number)
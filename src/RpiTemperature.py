@@ -5,8 +5,28 @@
 #
 # KHr
 
-from dbus.mainloop.glib import DBusGMainLoop
+import os
 import sys
+import time
+import configparser
+
+# KHr: inetbox2mqtt provides all temperature services itself (CPU, Truma room and water) if [dbus]
+# is enabled in its config, the RpiTemperature service should be removed then (see README.md)
+def exported_by_inetbox2mqtt():
+    config = configparser.ConfigParser()
+    try:
+        config.read(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etc', 'inetbox2mqtt'))
+        return config.getboolean('dbus', 'enabled', fallback=False)
+    except (configparser.Error, ValueError):
+        return False
+
+if __name__ == "__main__" and exported_by_inetbox2mqtt():
+    # the services would conflict with the ones of inetbox2mqtt, check again in a minute
+    print("The temperatures are exported by inetbox2mqtt ([dbus] enabled), remove the RpiTemperature service")
+    time.sleep(60)
+    sys.exit(0)
+
+from dbus.mainloop.glib import DBusGMainLoop
 if sys.version_info.major == 2:
     import gobject
     from gobject import idle_add
@@ -17,6 +37,8 @@ import platform
 from threading import Timer
 import logging
 import os
+import json
+import inotify
 
 from pprint import pprint
 
@@ -27,16 +49,83 @@ from settingsdevice import SettingsDevice  # available in the velib_python repos
 
 dbusservice = None
 
+# KHr: Truma status snapshot written by inetbox2mqtt (see state_export.py)
+STATE_FILE = '/tmp/truma/status.json'
+# KHr: seconds between the updates of the CPU temperature, and of the Truma temperatures
+# if the snapshot can't be watched
+POLL_INTERVAL = 10
+
 def update():
-     update_temp("cpu",   dbus_cpu_service,   '/sys/devices/virtual/thermal/thermal_zone0/temp', convert=True)
-     update_temp("room",  dbus_room_service,  '/tmp/truma/current_temp_room')
-     update_temp("water", dbus_water_service, '/tmp/truma/current_temp_water')
+     update_cpu()
+     update_truma()
+     return True
+
+
+def update_cpu():
+     update_temp("cpu",   dbus_cpu_service,   read_file('/sys/devices/virtual/thermal/thermal_zone0/temp'), convert=True)
+     return True
+
+
+def update_truma():
+     state = read_state(STATE_FILE)
+     update_temp("room",  dbus_room_service,  state.get('current_temp_room'))
+     update_temp("water", dbus_water_service, state.get('current_temp_water'))
      return True
 
 
-# KHr: Update temperature
-def update_temp(name, dbus_service, file, convert=False):
-    if not os.path.exists(file):
+# KHr: Update the Truma temperatures only when inetbox2mqtt replaces the snapshot, the watch is
+# on the directory because the snapshot file itself is replaced (moved there by os.replace)
+WATCH_MASK = inotify.IN_MOVED_TO | inotify.IN_DELETE
+
+def watch_state():
+    global watcher
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    if watcher is None:
+        watcher = inotify.Inotify()
+        gobject.io_add_watch(watcher.fileno(), gobject.PRIORITY_DEFAULT, gobject.IO_IN, state_changed)
+    watcher.add_watch(os.path.dirname(STATE_FILE), WATCH_MASK)
+
+
+def state_changed(fd, condition):
+    changed = False
+    for wd, mask, name in watcher.read():
+        if mask & inotify.IN_IGNORED: # directory deleted, e.g. /tmp cleaned up
+            try:
+                watch_state()
+            except OSError as e:
+                logging.warning(f"Failed to watch {STATE_FILE}, polling instead: {e}")
+                gobject.timeout_add(POLL_INTERVAL * 1000, update_truma)
+            changed = True
+        elif name == os.path.basename(STATE_FILE):
+            changed = True
+    if changed:
+        update_truma()
+    return True
+
+watcher = None
+
+
+# KHr: Read a text file, None if it doesn't exist
+def read_file(file):
+    try:
+        with open(file,'r') as fd:
+            return fd.read().strip()
+    except OSError:
+        return None
+
+
+# KHr: Read the status snapshot, it is replaced atomically by inetbox2mqtt
+def read_state(file):
+    try:
+        with open(file,'r') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+# KHr: Update temperature, content is None if the source is not available
+def update_temp(name, dbus_service, content, convert=False):
+    if content is None:
         if dbus_service['/Connected'] != 0:
             logging.info(f"{name} temperature interface disconnected")
             dbus_service['/Connected'] = 0
@@ -44,19 +133,18 @@ def update_temp(name, dbus_service, file, convert=False):
         if dbus_service['/Connected'] != 1:
             logging.info(f"{name} temperature interface connected")
             dbus_service['/Connected'] = 1
-        with open(file,'r') as fd:
-            content = fd.read().strip()
-            if content:
-                try:
-                    value = float(content)
-                except:
-                    logging.warning(f"Invalid temperature value: {file} {content}")
-                    return
-            else:
-                    logging.warning(f"Temperature file is empty: {file}")
-                    return
-            if convert:
-                value = round(value / 1000.0, 1)
+        if content != "":
+            try:
+                value = float(content)
+            except:
+                logging.warning(f"Invalid {name} temperature value: {content}")
+                return
+        else:
+                logging.warning(f"{name} temperature is empty")
+                return
+        if convert:
+            value = round(value / 1000.0, 1)
+        if dbus_service['/Temperature'] != value: # no D-Bus signal for unchanged values
             dbus_service['/Temperature'] = value
 
 
@@ -234,10 +322,15 @@ readSettings(settingObjects)
 
 # Do a first update so that all the readings appear.
 update()
-# update every 10 seconds - temperature and humidity should move slowly so no need to demand
-# too much CPU time
-#
-gobject.timeout_add(10000, update)
+# update the Truma temperatures whenever inetbox2mqtt writes them, the CPU temperature every
+# 10 seconds - it should move slowly so no need to demand too much CPU time
+try:
+    watch_state()
+    gobject.timeout_add(POLL_INTERVAL * 1000, update_cpu)
+    logging.info(f"watching {STATE_FILE}")
+except OSError as e:
+    logging.warning(f"Failed to watch {STATE_FILE}, polling instead: {e}")
+    gobject.timeout_add(POLL_INTERVAL * 1000, update)
 
 print('Connected to dbus, and switching over to gobject.MainLoop() (= event based)')
 mainloop = gobject.MainLoop()
@@ -0,0 +1,163 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Capture of the raw LIN traffic, for reproducing field problems and for the replay benchmarks
+#
+# RecordingSerial wraps the serial port of Lin and records every chunk of received and sent bytes
+# with a monotonic timestamp. The records go into one of two preallocated buffers; a writer
+# thread swaps the buffers and writes the full one to the capture file, so recording never waits
+# for the disk in the bus loop, and the lock is only held for the swap. If the buffer is full,
+# records are dropped and counted.
+# When the capture file reaches max_size bytes, it is renamed to <file>.1 (replacing the previous
+# one) and a new file is started, so a capture takes at most twice max_size on the disk.
+#
+# File format: the magic b"LINCAP" and the format version (u16), then one record per chunk:
+# timestamp (f64, seconds of time.monotonic()), direction (u8, 0 = received, 1 = sent),
+# length (u16), data. All numbers are little endian.
+#
+# python3 src/capture.py <file> prints a capture.
+#
+
+import os
+import sys
+import struct
+import logging
+import threading
+from time import monotonic
+
+log = logging.getLogger(__name__)
+
+MAGIC   = b"LINCAP"
+VERSION = 1
+HEADER  = struct.Struct("<6sH")
+RECORD  = struct.Struct("<dBH")
+RX = 0
+TX = 1
+FLUSH_INTERVAL = 1.0 # seconds
+MAX_SIZE = 50000000  # bytes per capture file
+
+
+class RecordingSerial:
+
+    def __init__(self, serial, path, buffer_size=32768, max_size=MAX_SIZE):
+        self.serial = serial
+        self.path = path
+        self.max_size = max_size
+        self.buffer = bytearray(buffer_size) # records are appended here
+        self.spare = bytearray(buffer_size)  # written to the file by the writer thread
+        self.used = 0     # bytes of records in buffer
+        self.dropped = 0  # records dropped because the buffer was full
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.file = None
+        self.size = 0     # of the capture file
+        self._open()
+        self.thread = threading.Thread(target=self._writer, name="capture", daemon=True)
+        self.thread.start()
+        log.info(f"capturing LIN traffic to {path}")
+
+    # everything else (in_waiting, fileno, flush, ...) is passed to the serial port
+    def __getattr__(self, name):
+        return getattr(self.serial, name)
+
+    @property
+    def in_waiting(self):
+        return self.serial.in_waiting
+
+    def read(self, n=1):
+        data = self.serial.read(n)
+        if data:
+            self._record(RX, data)
+        return data
+
+    def write(self, data):
+        self._record(TX, data)
+        return self.serial.write(data)
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        self.file.close()
+        if self.dropped:
+            log.warning(f"capture: {self.dropped} records dropped")
+
+    def _record(self, direction, data):
+        record = RECORD.pack(monotonic(), direction, len(data)) + data
+        n = len(record)
+        with self.lock:
+            buffer = self.buffer
+            if self.used + n > len(buffer):
+                self.dropped += 1
+                return
+            buffer[self.used:self.used + n] = record
+            self.used += n
+            if self.used >= len(buffer) // 2:
+                self.wake.set()
+
+    # start a new capture file, the previous one is kept as <file>.1
+    def _open(self):
+        if self.file is not None:
+            self.file.close()
+            os.replace(self.path, self.path + ".1")
+            log.info(f"capture: {self.path} rotated")
+        self.file = open(self.path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.size = HEADER.size
+
+    # write the records of the spare buffer, a new file is started between two records
+    def _write(self, data):
+        start = pos = 0
+        while pos < len(data):
+            n = RECORD.size + RECORD.unpack_from(data, pos)[2]
+            if self.size + pos - start > HEADER.size and self.size + pos + n - start > self.max_size:
+                self.file.write(data[start:pos])
+                self._open()
+                start = pos
+            pos += n
+        self.file.write(data[start:])
+        self.size += len(data) - start
+        self.file.flush()
+
+    def _writer(self):
+        while True:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            with self.lock:
+                self.buffer, self.spare = self.spare, self.buffer
+                used = self.used
+                self.used = 0
+            try:
+                if used:
+                    self._write(memoryview(self.spare)[:used])
+            except OSError as e:
+                log.error(f"capture: {e}")
+                return
+            if self.closed:
+                return
+
+
+# the records of a capture file as (timestamp, direction, data)
+def read_capture(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is no LIN capture of version {VERSION}")
+    pos = HEADER.size
+    records = []
+    while pos + RECORD.size <= len(data):
+        t, direction, n = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        records.append((t, direction, data[pos:pos + n]))
+        pos += n
+    return records
+
+
+if __name__ == "__main__":
+    records = read_capture(sys.argv[1])
+    t0 = records[0][0] if records else 0
+    for t, direction, data in records:
+        print(f"{t - t0:10.4f} {'<' if direction == RX else '>'} {data.hex(' ')}")
@@ -0,0 +1,36 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# LIN checksum calculation (LIN Specification Package Revision 2.2A, chapter 2.3.1.5)
+#
+# The checksum contains the inverted eight bit sum with carry over all data bytes (classic checksum)
+# or all data bytes and the protected identifier (enhanced checksum).
+# The bytes are summed up with sum() in one pass and the carries are folded back afterwards
+# (end-around carry), which gives the same result as adding byte by byte with carry.
+# All functions accept bytes, bytearray or memoryview slices, so no copy is necessary.
+# Like the original implementation, a checksum of 0xFF is sent as 0x00.
+
+
+# fold the carries of a sum back into the lower 8 bits
+def _fold(s):
+    while s > 0xFF:
+        s = (s & 0xFF) + (s >> 8)
+    return s
+
+
+def _invert(s):
+    cs = ~s & 0xFF
+    if cs == 0xFF:
+        cs = 0
+    return cs
+
+
+# classic checksum over the data bytes only (diagnostic frames 0x3C/0x3D)
+def classic(data):
+    return _invert(_fold(sum(data)))
+
+
+# enhanced checksum over the protected identifier and the data bytes
+def enhanced(pid, data):
+    return _invert(_fold(pid + sum(data)))
@@ -0,0 +1,229 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Export of the Truma status onto the Venus OS D-Bus from within inetbox2mqtt, replacing
+# RpiTemperature.py and its process (see the [dbus] section of the config file)
+#
+# The CPU, room and water temperatures get a com.victronenergy.temperature service each, with the
+# same names and device instances as in RpiTemperature.py. The room service also carries the
+# heater state and the error code under /Truma/... The CPU temperature is read every
+# CPU_INTERVAL seconds in the GLib thread.
+#
+# dbus-python and velib_python need a GLib main loop, which runs in a thread of its own. The
+# asyncio side hands the changed values over with update(); they are applied in the GLib
+# thread, and only changed values are written to D-Bus.
+# /TemperatureType and /CustomName are stored in the Venus OS settings under the same keys as
+# RpiTemperature.py uses (/Settings/Temperature/<id>/...), so names and types set in the GUI
+# are kept across restarts and when switching from RpiTemperature.py.
+# For testing, mocked VeDbusService and SettingsDevice classes and a bus (e.g. a private session
+# bus) can be passed, apply() then sets the values directly.
+#
+
+import os
+import sys
+import platform
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+VELIB_PATH = "/opt/victronenergy/dbus-modem"
+BASE = "com.victronenergy"
+
+# name, physical connection, product, custom name, id, device instance, status key of the
+# temperature (None: the CPU temperature)
+SERVICES = (
+    ("cpu",   "RpiCpu",     "Raspberry Pi", "CPU",    6, 29, None),
+    ("room",  "TrumaRoom",  "Truma C4",     "Indoor", 7, 30, "current_temp_room"),
+    ("water", "TrumaWater", "Truma C4",     "Water",  8, 31, "current_temp_water"),
+)
+
+# persistent settings of each service: path -> default, min, max (as in RpiTemperature.py)
+SETTINGS = {
+    '/TemperatureType': [2, 0, 3],
+    '/CustomName':      ['', 0, 0],
+}
+
+CPU_TEMP_FILE = "/sys/devices/virtual/thermal/thermal_zone0/temp"
+CPU_INTERVAL  = 10 # seconds
+
+# further status keys and the path on the room service
+HEATER_PATHS = {
+    "operating_status": "/Truma/OperatingStatus",
+    "heating_mode":     "/Truma/HeatingMode",
+    "error_code":       "/Truma/ErrorCode",
+}
+
+
+class DbusExport:
+
+    def __init__(self, service_class=None, bus=None, settings_class=None):
+        self.service_class = service_class
+        self.settings_class = settings_class
+        self.settings = None
+        self.setting_paths = {} # setting -> (service, path)
+        self.bus = bus
+        self.services = {}     # name -> VeDbusService
+        self.lin_services = [] # the Truma services, connected while the CPplus is alive
+        self.paths = {}        # status key -> (service, path, conversion)
+        self.pending = {}      # values handed over by update(), not yet applied
+        self.scheduled = False
+        self.lock = threading.Lock()
+        self.thread = None
+        self.loop = None
+        self.idle_add = None
+
+    # start the GLib main loop thread and create the services in it
+    def start(self):
+        sys.path.insert(1, VELIB_PATH)
+        from gi.repository import GLib
+        from dbus.mainloop.glib import DBusGMainLoop
+        DBusGMainLoop(set_as_default=True)
+        self.idle_add = GLib.idle_add
+        self.loop = GLib.MainLoop()
+        ready = threading.Event()
+        error = []
+
+        def run():
+            try:
+                self.create_services()
+                self.update_cpu()
+                GLib.timeout_add_seconds(CPU_INTERVAL, self.update_cpu)
+            except Exception as e:
+                error.append(e)
+                return
+            finally:
+                ready.set()
+            self.loop.run()
+
+        self.thread = threading.Thread(target=run, name="dbus", daemon=True)
+        self.thread.start()
+        ready.wait()
+        if error:
+            raise error[0]
+        log.info(f"D-Bus services: {', '.join(self.service_names())}")
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.quit()
+            self.thread.join()
+
+    def service_names(self):
+        return [f"{BASE}.temperature.{physical}{id:02d}" for name, physical, product, custom, id, instance, key in SERVICES]
+
+    def create_services(self):
+        if self.service_class is None:
+            from vedbus import VeDbusService
+            self.service_class = VeDbusService
+        if self.settings_class is None:
+            from settingsdevice import SettingsDevice
+            self.settings_class = SettingsDevice
+        if self.bus is None:
+            import dbus
+            self.bus = dbus.SessionBus() if 'DBUS_SESSION_BUS_ADDRESS' in os.environ else dbus.SystemBus()
+        supported = {}
+        for (name, physical, product, custom, id, instance, key), service_name in zip(SERVICES, self.service_names()):
+            service = self.service_class(service_name, self.bus)
+            service.add_path('/Mgmt/ProcessName', "inetbox2mqtt")
+            service.add_path('/Mgmt/ProcessVersion', 'Running on Python ' + platform.python_version())
+            service.add_path('/Mgmt/Connection', "LIN")
+            service.add_path('/DeviceInstance', instance)
+            service.add_path('/ProductId', 0)
+            service.add_path('/ProductName', product)
+            service.add_path('/FirmwareVersion', platform.system())
+            service.add_path('/HardwareVersion', "inetbox2mqtt")
+            service.add_path('/Connected', 0)  # until the CPplus is alive or the CPU temperature is read
+            service.add_path('/Temperature', [])
+            service.add_path('/Status', 0)
+            setting = f"/Settings/Temperature/{id}"
+            for path, default in SETTINGS.items():
+                supported[setting + path] = [setting + path] + default
+                self.setting_paths[setting + path] = (service, path)
+            service.add_path('/TemperatureType', 2, writeable=True,
+                             onchangecallback=lambda path, value, setting=setting: self._gui_changed(setting, path, value))
+            service.add_path('/CustomName', custom, writeable=True,
+                             onchangecallback=lambda path, value, setting=setting: self._gui_changed(setting, path, value))
+            service.add_path('/Function', 1, writeable=True)
+            self.services[name] = service
+            if key is not None:
+                self.lin_services.append(service)
+                self.paths[key] = (service, '/Temperature', float)
+        room = self.services["room"]
+        for key, path in HEATER_PATHS.items():
+            room.add_path(path, [])
+            self.paths[key] = (room, path, int if key == "error_code" else str)
+        # the stored settings, created with their defaults if they don't exist yet
+        self.settings = self.settings_class(bus=self.bus, supportedSettings=supported,
+                                            eventCallback=self._setting_changed)
+        for setting, (service, path) in self.setting_paths.items():
+            service[path] = self.settings[setting]
+
+    # a value changed in the GUI is stored in the settings
+    def _gui_changed(self, setting, path, value):
+        log.info(f"storing setting {setting + path}: {value}")
+        self.settings[setting + path] = value
+        return True
+
+    # a setting changed elsewhere is applied to the service
+    def _setting_changed(self, setting, old, new):
+        target = self.setting_paths.get(setting)
+        if target is not None:
+            service, path = target
+            service[path] = new
+
+    # CPU temperature as RpiTemperature.py reads it, returns True for keeping the GLib timer
+    def update_cpu(self, path=CPU_TEMP_FILE):
+        service = self.services["cpu"]
+        try:
+            with open(path) as f:
+                value = round(int(f.read()) / 1000.0, 1)
+        except (OSError, ValueError):
+            value = None
+        connected = 0 if value is None else 1
+        if service['/Connected'] != connected:
+            service['/Connected'] = connected
+        if value is not None and service['/Temperature'] != value:
+            service['/Temperature'] = value
+        return True
+
+    # hand changed status values over to the GLib thread, callable from the asyncio loop
+    def update(self, changes):
+        with self.lock:
+            self.pending.update(changes)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.idle_add(self._apply_pending)
+
+    def _apply_pending(self):
+        with self.lock:
+            changes = self.pending
+            self.pending = {}
+            self.scheduled = False
+        self.apply(changes)
+        return False # run once
+
+    # write the changed values to D-Bus, returns the number of D-Bus writes
+    def apply(self, changes):
+        writes = 0
+        if "alive" in changes:
+            connected = 1 if changes["alive"] == "ON" else 0
+            for service in self.lin_services:
+                if service['/Connected'] != connected:
+                    service['/Connected'] = connected
+                    writes += 1
+        for key, value in changes.items():
+            target = self.paths.get(key)
+            if target is None:
+                continue
+            service, path, conversion = target
+            try:
+                value = conversion(value)
+            except (TypeError, ValueError):
+                log.debug(f"D-Bus export: invalid value {key}: {value}")
+                continue
+            if service[path] != value:
+                service[path] = value
+                writes += 1
+        return writes
@@ -4,12 +4,118 @@
 # slighty changes, hidden status display, typros
 # modify logging structure
 
-from tools import calculate_checksum
+import checksum
 import conversions as cnv
 import logging
+import struct
 
 log = logging.getLogger(__name__)
 
+
+# Decoder for one status buffer layout of STATUS_BUFFER_TYPES: the layout is compiled once
+# into a struct format, so a buffer is decoded with a single unpack_from call.
+# Fields which are not stored are skipped as pad bytes, multi-byte fields are little endian.
+class StatusBufferDecoder:
+
+    FORMATS = {1: "B", 2: "H", 4: "I"}
+
+    def __init__(self, status_buffer_map):
+        fmt = "<"
+        names = []
+        raw = []
+        keys = list(status_buffer_map.keys())
+        keys.sort()
+        for key in keys:
+            name, size, store = status_buffer_map[key][:3]
+            if not store:
+                fmt += f"{size}x"
+                continue
+            if size in self.FORMATS:
+                fmt += self.FORMATS[size]
+            else:
+                fmt += f"{size}s"
+                raw.append(len(names))
+            names.append(name)
+        self.struct = struct.Struct(fmt)
+        self.names = tuple(names)
+        self.keys = frozenset(names)
+        # fields without a struct format are unpacked as bytes and converted afterwards
+        self.raw = tuple(raw)
+        # buffers shorter than the layout are decoded from a zero padded copy
+        self.pad = bytearray(self.struct.size)
+
+    def decode(self, status_buffer):
+        n = len(status_buffer)
+        if n < self.struct.size:
+            self.pad[:n] = status_buffer
+            self.pad[n:] = bytes(self.struct.size - n)
+            status_buffer = self.pad
+        values = self.struct.unpack_from(status_buffer)
+        if self.raw:
+            values = list(values)
+            for i in self.raw:
+                if self.names[i] == "display":
+                    values[i] = values[i].hex(" ")
+                else:
+                    values[i] = int.from_bytes(values[i], "little")
+        return values
+
+# Encoder for a write layout of STATUS_BUFFER_TYPES (e.g. 0x0C 0x32): the layout is compiled once into
+# a struct format. The fields are packed into a preallocated buffer, the checksum is patched in place
+# and the seven transport-layer frames are views of a second preallocated buffer.
+# The frames are only valid until the next call of encode().
+class StatusBufferEncoder:
+
+    FORMATS = {1: "B", 2: "H", 4: "I"}
+    # first frame of the upload: NAD 03, PCI 0x10 with length 0x29, SID 0xFA
+    FIRST_FRAME = bytes([0x03, 0x10, 0x29, 0xFA, 0x00, 0x1F, 0x00, 0x1E])
+    SEGMENTS = 6
+    SEGMENT_SIZE = 6
+    FRAME_SIZE = 9
+
+    def __init__(self, buf_id, status_buffer_map, preamble, checksum_start):
+        fmt = "<"
+        keys = []
+        checksum_pos = None
+        map_keys = list(status_buffer_map.keys())
+        map_keys.sort()
+        for key in map_keys:
+            map_key, size = status_buffer_map[key][2], status_buffer_map[key][1]
+            if map_key == "":
+                fmt += f"{size}x"
+                continue
+            if map_key == "checksum":
+                checksum_pos = struct.calcsize(fmt)
+            fmt += self.FORMATS[size]
+            keys.append(map_key)
+        self.struct = struct.Struct(fmt)
+        self.keys = tuple(keys)
+        self.checksum_start = checksum_start
+        self.offset = len(preamble) + len(buf_id)
+        self.checksum_pos = self.offset + checksum_pos
+        self.buffer = bytearray(max(self.offset + self.struct.size, self.SEGMENTS * self.SEGMENT_SIZE))
+        self.buffer[:self.offset] = preamble + buf_id
+        self.frames = bytearray((self.SEGMENTS + 1) * self.FRAME_SIZE)
+        self.frames[:self.FRAME_SIZE] = self.FIRST_FRAME + bytes([checksum.classic(self.FIRST_FRAME)])
+        for i in range(1, self.SEGMENTS + 1):
+            self.frames[i * self.FRAME_SIZE:i * self.FRAME_SIZE + 2] = bytes([0x03, 0x20 + i])
+        view = memoryview(self.frames)
+        self.views = [view[i * self.FRAME_SIZE:(i + 1) * self.FRAME_SIZE] for i in range(self.SEGMENTS + 1)]
+
+    # packs the status values, returns the frames and the buffer checksum - raises KeyError for missing keys
+    def encode(self, status):
+        buf = self.buffer
+        self.struct.pack_into(buf, self.offset, *[status[key][0] for key in self.keys])
+        buf[self.checksum_pos] = 0
+        cs = checksum.classic(memoryview(buf)[self.checksum_start:])
+        buf[self.checksum_pos] = cs
+        frames = self.frames
+        for i in range(1, self.SEGMENTS + 1):
+            pos = i * self.FRAME_SIZE
+            frames[pos + 2:pos + 8] = buf[(i - 1) * self.SEGMENT_SIZE:i * self.SEGMENT_SIZE]
+            frames[pos + 8] = checksum.classic(self.views[i][:8])
+        return self.views, cs
+
 class InetboxApp:
 
     ENERGY_MIX_MAPPING = {
@@ -213,6 +319,10 @@ class InetboxApp:
         },
     }
 
+    # compiled once at import, key is the buffer id
+    STATUS_BUFFER_DECODERS = {buf_id: StatusBufferDecoder(status_buffer_map)
+                              for buf_id, status_buffer_map in STATUS_BUFFER_TYPES.items()}
+
     STATUS_CONVERSION_FUNCTIONS = {  # pair for reading from buffer and writing to buffer, None if writing not allowed
         "command_counter": (int, int,),
         "checksum": (int, int,),
@@ -297,9 +407,30 @@ class InetboxApp:
             log.setLevel(logging.DEBUG)
             log.info("INET debug log enabled")
 
-
-        log.debug(f"Status: {self.status}")
+        # cached, so the hot paths do no formatting at all if debug is off
+        self.debug = log.isEnabledFor(logging.DEBUG)
+        if self.debug: log.debug(f"Status: {self.status}")
         self.reflect = reflect
+        self.status_buffer_encoders = {
+            buf_id: StatusBufferEncoder(buf_id, self.STATUS_BUFFER_TYPES[buf_id], self.STATUS_BUFFER_PREAMBLE, self.STATUS_HEADER_CHECKSUM_START)
+            for buf_id in (self.STATUS_BUFFER_HEADER_WRITE_STATUS, self.STATUS_BUFFER_HEADER_WRITE_02_STATUS)
+        }
+        # last received raw buffer per buffer id, for skipping unchanged buffers
+        # it is cleared, whenever the status is changed outside of process_status_buffer_update
+        self.status_buffers = {}
+        # buffer ids decoded since the start, all values of the first buffer of an id are flagged,
+        # including the ones equal to the defaults in status
+        self.status_buffers_seen = set()
+        # committed status snapshot: values changed since the publisher took the last one,
+        # see commit_status() and take_status()
+        self.status_version = 0
+        self.committed_status = {}
+        # asyncio.Event of the publisher, set whenever a changed value is committed
+        self.status_event = None
+        # metrics, see metrics.py
+        self.cnt_buffers = 0           # status buffers received
+        self.cnt_buffers_unchanged = 0 # status buffers skipped, because they didn't change
+        self.cnt_buffers_unknown = 0   # status buffers with an unknown id
 
     def map_or_debug(self, mapping, value):
         if value in mapping:
@@ -387,31 +518,39 @@ class InetboxApp:
         self.display_status.update(data)
 
     def process_status_buffer_update(self, buf_id, status_buffer):
-        log.debug(f"Status ID[{buf_id.hex(' ')}]:> {status_buffer.hex(' ')}")
+        if self.debug: log.debug(f"Status ID[{buf_id.hex(' ')}]:> {status_buffer.hex(' ')}")
 
-        if not(buf_id in self.STATUS_BUFFER_TYPES.keys()):
+        self.cnt_buffers += 1
+        decoder = self.STATUS_BUFFER_DECODERS.get(buf_id)
+        if decoder is None:
+            self.cnt_buffers_unknown += 1
             log.debug("unkown buffer type - no processing")
             return
 
-        status_buffer_map = self.STATUS_BUFFER_TYPES[buf_id]
+        # change detection: an unchanged buffer is skipped entirely, otherwise only the
+        # changed values are flagged for mqtt
+        if self.status_buffers.get(buf_id) == status_buffer:
+            self.cnt_buffers_unchanged += 1
+            return
+        self.status_buffers[buf_id] = bytes(status_buffer)
+        first = buf_id not in self.status_buffers_seen
+        if first:
+            self.status_buffers_seen.add(buf_id)
+
         parsed_status_buffer = {}
+        for status_key, val in zip(decoder.names, decoder.decode(status_buffer)):
+            old = self.status.get(status_key)
+            if first or (old is None) or (old[0] != val):
+                parsed_status_buffer[status_key] = [val, True, False]
 
-        val = 0
-
-        keys = list(status_buffer_map.keys())
-        keys.sort()
-        for key in keys:
-            val_a = val
-            val += status_buffer_map[key][1]
-            if status_buffer_map[key][2]:
-                status_key = status_buffer_map[key][0]
-                if (status_key == "display"):
-                    parsed_status_buffer[status_key] = [status_buffer[val_a:val].hex(" "), True, False]
-                else:
-                    parsed_status_buffer[status_key] = [int.from_bytes(status_buffer[val_a:val],"little"), True, False]
+        # other buffers with the same keys must be decoded again, even if they are unchanged
+        if parsed_status_buffer:
+            for other_id in list(self.status_buffers.keys()):
+                if other_id != buf_id and not self.STATUS_BUFFER_DECODERS[other_id].keys.isdisjoint(parsed_status_buffer):
+                    del self.status_buffers[other_id]
 
         self.status.update(parsed_status_buffer)
-        log.debug(f"Update: {parsed_status_buffer}")
+        if self.debug: log.debug(f"Update: {parsed_status_buffer}")
 
 
     def _get_status_buffer_for_writing(self):
@@ -420,76 +559,10 @@ class InetboxApp:
         if not self.upload_buffer:
             return None
 
-        status_buffer_map = self.STATUS_BUFFER_TYPES[self.STATUS_BUFFER_HEADER_WRITE_STATUS]
-
-        # increase output message counter
-        self.status["command_counter"] = [(self.status["command_counter"][0] + 1) % 0xFF, True]
-        self.status["checksum"] = [0, True, False]
-
-        keys = list(status_buffer_map.keys())
-        keys.sort()
-
-        # get current status buffer contents as dict
-        # routine is needed twice to calculate the correct checksum
-        try:
-            binary_buffer_contents = bytearray(0)
-            for key in keys:
-                map_key = status_buffer_map[key][2]
-                val = status_buffer_map[key][1]
-                if (map_key == ""):
-                    s = 0
-                    binary_buffer_contents += s.to_bytes(val, "little")
-                else:
-                    binary_buffer_contents += self.status[map_key][0].to_bytes(val, "little")
-                    self.status[map_key] = [self.status[map_key][0], self.status[map_key][1], False]
-        except KeyError:
-            self.upload_buffer = 0
-            log.debug(f"KeyError in status_buffer for writing")
-            return None
-
-        log.debug(f"result of heater status-transfer: {binary_buffer_contents.hex(' ')}")
-
-# calculate checksum
-        self.status["checksum"] = [calculate_checksum(
-            (
-                self.STATUS_BUFFER_PREAMBLE
-                + self.STATUS_BUFFER_HEADER_WRITE_STATUS
-                + binary_buffer_contents
-            )[self.STATUS_HEADER_CHECKSUM_START :]
-        ), True, False]
-
-        try:
-            binary_buffer_contents = bytearray(0)
-            for key in keys:
-                map_key = status_buffer_map[key][2]
-                val = status_buffer_map[key][1]
-                if (map_key == ""):
-                    s = 0
-                    binary_buffer_contents += s.to_bytes(val, "little")
-                else:
-                    binary_buffer_contents += self.status[map_key][0].to_bytes(val, "little")
-        except KeyError:
+        s = self._encode_status_buffer(self.STATUS_BUFFER_HEADER_WRITE_STATUS)
+        if s is None:
             self.upload_buffer = 0
             log.debug(f"KeyError in status_buffer for writing")
-            return None
-
-#        self.upload_buffer = True
-
-        send_buffer = self.STATUS_BUFFER_PREAMBLE + self.STATUS_BUFFER_HEADER_WRITE_STATUS + binary_buffer_contents
-
-        s = [
-            bytearray([0x03, 0x10, 0x29, 0xFA, 0x00, 0x1F, 0x00, 0x1E]),
-            bytearray([0x03, 0x21]) + send_buffer[0:6],
-            bytearray([0x03, 0x22]) + send_buffer[6:12],
-            bytearray([0x03, 0x23]) + send_buffer[12:18],
-            bytearray([0x03, 0x24]) + send_buffer[18:24],
-            bytearray([0x03, 0x25]) + send_buffer[24:30],
-            bytearray([0x03, 0x26]) + send_buffer[30:36],
-             ]
-        for q in s:
-            cs = calculate_checksum(q)
-            q.append(cs)
-            log.debug(f"buffer for writing: {q.hex(' ')}")
         return s
 
     def _get_status_buffer1_for_writing(self):
@@ -498,76 +571,36 @@ class InetboxApp:
         if not self.upload02_buffer:
             return None
 
-        status_buffer_map = self.STATUS_BUFFER_TYPES[self.STATUS_BUFFER_HEADER_WRITE_02_STATUS]
+        s = self._encode_status_buffer(self.STATUS_BUFFER_HEADER_WRITE_02_STATUS)
+        if s is None:
+            self.upload02_buffer = 0
+            log.debug(f"KeyError in status_buffer1 for writing")
+        return s
+
+    # build the transport-layer frames for uploading a write buffer, None if a status key is missing
+    def _encode_status_buffer(self, buf_id):
+        encoder = self.status_buffer_encoders[buf_id]
 
         # increase output message counter
+        self.status_buffers.clear()
         self.status["command_counter"] = [(self.status["command_counter"][0] + 1) % 0xFF, True]
         self.status["checksum"] = [0, True, False]
 
-        keys = list(status_buffer_map.keys())
-        keys.sort()
-
-        # get current status buffer contents as dict
-        # routine is needed twice to calculate the correct checksum
         try:
-            binary_buffer_contents = bytearray(0)
-            for key in keys:
-                map_key = status_buffer_map[key][2]
-                val = status_buffer_map[key][1]
-                if (map_key == ""):
-    #                s = status_buffer_map[key][3]
-                    s=0
-                    binary_buffer_contents += s.to_bytes(val, "little")
-                else:
-                    binary_buffer_contents += self.status[map_key][0].to_bytes(val, "little")
-                    self.status[map_key] = [self.status[map_key][0], self.status[map_key][1], False]
-
+            s, cs = encoder.encode(self.status)
         except KeyError:
-            log.debug(f"KeyError in status_buffer1 for writing")
-            self.upload02_buffer = 0
             return None
 
-        log.debug(f"result of aircon status-transfer: {binary_buffer_contents.hex(' ')}")
-
-# calculate checksum
-        self.status["checksum"] = [calculate_checksum(
-            (
-                self.STATUS_BUFFER_PREAMBLE
-                + self.STATUS_BUFFER_HEADER_WRITE_02_STATUS
-                + binary_buffer_contents
-            )[self.STATUS_HEADER_CHECKSUM_START :]
-        ), True, False]
-
-        try:
-            binary_buffer_contents = bytearray(0)
-            for key in keys:
-                map_key = status_buffer_map[key][2]
-                val = status_buffer_map[key][1]
-                if (map_key == ""):
-                    s = 0
-                    binary_buffer_contents += s.to_bytes(val, "little")
-                else:
-                    binary_buffer_contents += self.status[map_key][0].to_bytes(val, "little")
-        except KeyError:
-            log.debug(f"KeyError in status_buffer1 for writing")
-            self.upload02_buffer = 0
-
-        send_buffer = self.STATUS_BUFFER_PREAMBLE + self.STATUS_BUFFER_HEADER_WRITE_02_STATUS + binary_buffer_contents
-
-        s = [
-            bytearray([0x03, 0x10, 0x29, 0xFA, 0x00, 0x1F, 0x00, 0x1E]),
-            bytearray([0x03, 0x21]) + send_buffer[0:6],
-            bytearray([0x03, 0x22]) + send_buffer[6:12],
-            bytearray([0x03, 0x23]) + send_buffer[12:18],
-            bytearray([0x03, 0x24]) + send_buffer[18:24],
-            bytearray([0x03, 0x25]) + send_buffer[24:30],
-            bytearray([0x03, 0x26]) + send_buffer[30:36],
-             ]
-        for q in s:
-            cs = calculate_checksum(q)
-            q.append(cs)
-            log.debug(f"buffer for writing: {q.hex(' ')}")
+        # the values are on the way to the CPplus
+        for map_key in encoder.keys:
+            self.status[map_key] = [self.status[map_key][0], self.status[map_key][1], False]
+        self.status["checksum"] = [cs, True, False]
+        self.commit_status()
 
+        if self.debug:
+            log.debug(f"result of status-transfer {buf_id.hex(' ')}: {encoder.buffer[encoder.offset:].hex(' ')}")
+            for q in s:
+                log.debug(f"buffer for writing: {q.hex(' ')}")
         return s
 
     # This is the small api to the mqtt-engine
@@ -586,9 +619,10 @@ class InetboxApp:
         if self.STATUS_CONVERSION_FUNCTIONS[key] is None:
             raise Exception(f"Conversion function not defined - this key {key} isn't writeable?")
 #        log.info(f"Setting {key} to {value}")
-        log.debug(f"set_status: {key}:{value}")
+        if self.debug: log.debug(f"set_status: {key}:{value}")
         old_data = self.status[key][0]
         old_flg = self.status[key][2]
+        self.status_buffers.clear()
         # self.reflect chance the behavior of system control: True means that set commands reflected in control_status
         # False means that the control_status only changed after feedback from truma
         self.status[key] = [self.STATUS_CONVERSION_FUNCTIONS[key][1](value), self.reflect, old_flg]
@@ -597,24 +631,65 @@ class InetboxApp:
             if self.status[key][0] != old_data:
                 self.status[key][2] = True
 #        self.upload_buffer = True
-        log.debug(f"Status elements: {self.status}")
+        if self.debug: log.debug(f"Status elements: {self.status}")
 # check for heater-items
         map_key = []
         for k in self.STATUS_BUFFER_TYPES[self.STATUS_BUFFER_HEADER_WRITE_STATUS]:
             map_key += [self.STATUS_BUFFER_TYPES[self.STATUS_BUFFER_HEADER_WRITE_STATUS][k][2]]
         if key in map_key:
-            log.debug(f"heater: {key}:{self.status[key]}")
+            if self.debug: log.debug(f"heater: {key}:{self.status[key]}")
             if self.status[key][2]: self.upload_buffer = 2
 # check for aircon-items
         map_key = []
         for k in self.STATUS_BUFFER_TYPES[self.STATUS_BUFFER_HEADER_WRITE_02_STATUS]:
             map_key += [self.STATUS_BUFFER_TYPES[self.STATUS_BUFFER_HEADER_WRITE_02_STATUS][k][2]]
         if key in map_key:
-            log.debug(f"aircon: {key}:{self.status[key]}")
+            if self.debug: log.debug(f"aircon: {key}:{self.status[key]}")
             if self.status[key][2]: self.upload02_buffer = 2
         self.upload_wait = 3 # wait for 3 "fe"-cycles to collect commands
-        log.debug(f"upload_buffer: {self.upload_buffer}")
-        log.debug(f"upload02_buffer: {self.upload02_buffer}")
+        if self.debug:
+            log.debug(f"upload_buffer: {self.upload_buffer}")
+            log.debug(f"upload02_buffer: {self.upload02_buffer}")
+        self.commit_status()
+
+# Status snapshot for the publisher: the writers (LIN side, set commands) commit the values flagged
+# for mqtt as a new version, the publisher takes the committed values without waiting for anything.
+# Values committed twice before the publisher takes them are coalesced to the latest one.
+    def commit_status(self):
+        committed = self.committed_status
+        changed = False
+        for key, val in self.status.items():
+            if val[1]:
+                val[1] = False
+                changed = True
+                try:
+                    committed[key] = self.get_status(key)
+                except Exception as e:
+                    log.debug(f"commit_status {key}: {e}")
+        if changed:
+            self.status_version += 1
+            if self.status_event is not None:
+                self.status_event.set()
+
+# flag all values for mqtt, e.g. for a full snapshot with the heartbeat
+    def flag_all_status(self):
+        for val in self.status.values():
+            val[1] = True
+
+# returns the version and the values committed since the last call
+    def take_status(self):
+        committed = self.committed_status
+        self.committed_status = {}
+        return self.status_version, committed
+
+# metrics of the status decoding, see metrics.py
+    def metrics(self):
+        return {
+            "status_buffers": self.cnt_buffers,
+            "status_buffers_unchanged": self.cnt_buffers_unchanged,
+            "status_buffers_unknown": self.cnt_buffers_unknown,
+            "status_version": self.status_version,
+        }
 
 # Status-Dump - with False, it sends all status-values
 # with True it sends only a list of changed values - but reset the chance-flag
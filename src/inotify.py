@@ -0,0 +1,68 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Minimal inotify binding through ctypes (there is no inotify module in the Venus OS Python)
+#
+# The file descriptor is non-blocking, so it can be registered with an event loop, e.g. with
+# GLib.io_add_watch() in RpiTemperature.py, and read() is called whenever it is readable.
+#
+
+import os
+import ctypes
+import ctypes.util
+import struct
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_DELETE      = 0x00000200
+IN_IGNORED     = 0x00008000 # the watch was removed, e.g. the directory was deleted
+
+EVENT = struct.Struct("iIII") # wd, mask, cookie, length of the name
+
+_libc = None
+
+
+def _lib():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+class Inotify:
+
+    def __init__(self):
+        self.fd = _lib().inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_init1: {os.strerror(e)}")
+
+    def fileno(self):
+        return self.fd
+
+    # watch a file or directory, returns the watch descriptor
+    def add_watch(self, path, mask):
+        wd = _lib().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_add_watch {path}: {os.strerror(e)}")
+        return wd
+
+    # the pending events as (wd, mask, name), empty if there are none
+    def read(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return events
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = EVENT.unpack_from(data, pos)
+                pos += EVENT.size
+                events.append((wd, mask, data[pos:pos+length].rstrip(b"\0").decode()))
+                pos += length
+
+    def close(self):
+        os.close(self.fd)
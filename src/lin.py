@@ -14,25 +14,36 @@
 # Same approach for the raw PID 0xD8. This corresponds to a PID 0x18
 # This module has been optimised for high performance.
 
-from tools import calculate_checksum, PIN_MAP
+from tools import PIN_MAP
 import inetboxapp
+from metrics import Histogram
 import logging
 import asyncio
+from time import monotonic
 
 log = logging.getLogger(__name__)
 
 
+# Canned LIN responses - raw frames with checksum, they are written as they are
+# answer to the 0x18 poll (raw PID 0xD8): ff = update requested, fe = nothing to send
+RESP_D8_UPDATE   = bytes.fromhex("ff ff ff ff ff ff ff ff 27")
+RESP_D8_IDLE     = bytes.fromhex("fe ff ff ff ff ff ff ff 28")
+# ackn for a buffer download from CPplus
+RESP_BUFFER_ACKN = bytes.fromhex("03 01 fb ff ff ff ff ff 00")
+# registration (B2/B0) and heartbeat for NAD 03 with the inetbox ID-no 17 46 00 1f
+RESP_B2          = bytes.fromhex("03 06 f2 17 46 00 1f 00 87")
+RESP_B0          = bytes.fromhex("03 01 f0 ff ff ff ff ff 0b")
+RESP_HEARTBEAT   = bytes.fromhex("03 02 f9 00 ff ff ff ff 01")
+
+
 class Lin:
 
     ts_response_buffer = []
-    cpp_in_buffer = [bytes([]),bytes([]),bytes([]),bytes([]),bytes([]),bytes([])]
     updates_to_send = False
     update_request = False
-    cpp_buffer = {}
     cmd_buf = {}
     #cnt_rows = 1
     stop_async = False
-    cnt_in = 0
     # Same approach for the raw PID 0xD8. This corresponds to a PID 0x18
     d8_alive = False
 
@@ -40,10 +51,20 @@ class Lin:
     # Only for display control / slow event timing
     CNT_ROWS_MAX = 200
 
-    # Check Alive-status periodically - with 1ms delay it is appx. 9s
+    # Check Alive-status periodically - every 9s
     # there must be more than 1 D8-requests in this periode, than is alive status "ON"
     # otherwise it would set "OFF"
-    CNT_IN_MAX = 9000
+    # This is time based, so it works with the polling loop as well as with the event driven receive
+    ALIVE_PERIOD = 9
+
+    # LIN frame timing at 9600 baud (LIN 2.2A, chapter 2.3.2): a frame with 8 data bytes has a
+    # nominal length of 34 + 10 * (8 + 1) bits, the maximum frame length is 1.4 times the nominal length
+    BIT_TIME = 1 / 9600
+    FRAME_TIME_MAX = 1.4 * (34 + 10 * (8 + 1)) * BIT_TIME
+    # the USB serial converter delivers the bytes in chunks (FT232R latency timer 16ms)
+    RX_LATENCY = 0.016
+    # a frame must be completed within this time after the sync byte, otherwise it is dropped
+    FRAME_TIMEOUT = FRAME_TIME_MAX + RX_LATENCY
 
     #DISPLAY_STATUS_PIDS = [bytes([0x20]), bytes([0x61]), bytes([0xE2])]
 
@@ -53,6 +74,13 @@ class Lin:
     # starting in the 2. frame
     BUFFER_PREAMBLE = bytes([0x00, 0x00, 0x22, 0xFF, 0xFF, 0xFF, 0x54, 0x01])
 
+    # a buffer download consists of 6 segments (frames 0x21 - 0x26) with 6 bytes each:
+    # preamble (8 bytes), buffer id (2 bytes), status buffer (26 bytes)
+    BUFFER_SEGMENTS = 6
+    SEGMENT_SIZE    = 6
+    BUFFER_SIZE     = BUFFER_SEGMENTS * SEGMENT_SIZE
+    BUFFER_COMPLETE = (1 << BUFFER_SEGMENTS) - 1
+
 
     BUFFER_HEADER_RECV  = bytes([0x14, 0x33])
     BUFFER_HEADER_TIMER = bytes([0x18, 0x3D])
@@ -60,48 +88,92 @@ class Lin:
     BUFFER_HEADER_03    = bytes([0x0A, 0x15])
     BUFFER_HEADER_WRITE = bytes([0x0C, 0x32])
 
+    # bytes, which may precede the sync byte without a loss of sync: the break byte, after a 0x18 or
+    # 0x3D header also the response of a slave (8 data bytes and checksum), as it is read back from the bus
+    SYNC_SLACK_FRAME    = 1
+    SYNC_SLACK_RESPONSE = 10
+
+    # multi-frame receive for buffer download from CPplus: sync, PID 0x3C, NAD 03
+    BUFFER_TRANSFER_ID = bytes([0x00, 0x55, 0x3c, 0x03])
+
 
     def __init__(self, serial, pin_map, lin_debug, inet_debug):
         self.loop_state = False
         self.serial = serial
         self.pin_map = pin_map
         self.cnt_rows = 1
+        self.alive_ts = monotonic()
+        self.rx_event = None
+        self.rx_fd = None
+        self.rx_buf = bytearray()
+        self.rx_deadline = None
+        self.rx_skipped = 0 # bytes skipped by the sync search
+        self.rx_slack = self.SYNC_SLACK_RESPONSE
+        # metrics, see metrics.py
+        self.cnt_frames = 0            # frames processed, including the 0x18 and 0x3D polls
+        self.cnt_d8 = 0                # 0x18 polls
+        self.cnt_sync_lost = 0         # sync searches, which skipped more than the expected bytes
+        self.cnt_truncated = 0         # frames dropped, because the rest didn't arrive in time
+        self.cnt_unknown = 0           # frames without a dispatch entry
+        self.cnt_assemble_failures = 0 # buffer downloads, which couldn't be assembled
+        # time from reading (event mode: readability of) the bytes of a 0x18 poll to the written answer
+        self.rx_ts = monotonic()
+        self.d8_latency = Histogram()
+        # reassembly buffer for the buffer download, the segments are written in place.
+        # cpp_segments is a bitmask of the received segments, -1 means the transfer is dropped
+        self.cpp_frame = bytearray(self.BUFFER_SIZE)
+        self.cpp_view = memoryview(self.cpp_frame)
+        self.cpp_segments = -1
+        self.cnt_buffer_errors = 0     # segments out of order and preambles, which don't match
         if lin_debug:
             log.setLevel(logging.DEBUG)
             log.info("LIN debug log enabled")
 
         self.lin_debug = lin_debug
+        # cached, so the hot paths do no formatting at all if debug is off
+        self.debug = log.isEnabledFor(logging.DEBUG)
         self.app = inetboxapp.InetboxApp(inet_debug)
+        self.frame_dispatch = self._build_frame_dispatch()
         self.pin_map.set_led("lin_led", False)
 
 
-    def response_waiting(self):
-        return len(self.ts_response_buffer)
-
-
-    def _send_answer_str(self, data_str):
-        self._send_answer(self, serial, bytes.fromhex(data_str.replace(" ","")))
+    # single frame messages - answers to send buffer
+    # comments could be set "unshow" in info-log with a starting underline
+    # attention: this are raw frames with checksum -> see specification for details
+    # The table is built once - the keys are the raw frames, the responses are the canned bytes
+    def _build_frame_dispatch(self):
+        h = bytes.fromhex
+        return {
+            h("00 55 3c 7f 06 b2 00 17 46 00 1f 4b"): (self.prepare_tl_info_response, RESP_B2, "_B2 - response request"),  # B2-Message I - Initialization started
+            h("00 55 3c 03 06 b2 20 17 46 00 1f a7"): (self.prepare_tl_info_response, RESP_B2, "B2 - identifier for NAD 03"),  # B2-Message II: Looking for my ID-no 17 46 00 1f
+            h("00 55 3c 03 06 b2 22 17 46 00 1f a5"): (self.prepare_tl_info_response, RESP_B2, "B2 - initializer for NAD 03   -----------------> start registration"),  # B2-Message Initializer
+            h("00 55 3c 7f 06 b0 17 46 00 1f 03 4a"): (self.prepare_tl_info_response, RESP_B0, "B0 - init finalized - send ackn ---------------> registration finalized"),  # B0-Message - registation finalized
+            h("00 55 3c 03 05 b9 00 1f 00 00 ff 1f"): (self.prepare_tl_info_response, RESP_HEARTBEAT, "_Heartbeat for NAD 03 - send response"),  # Heartbeat
+            h("00 55 3c 03 10 29 bb 00 1f 00 1e ca"): (self.no_answer, "", "_Frame 1 of buffer-transfer (6 frames) from CPplus"), #0xBB notice to send buffer
+            h("00 55 3c 03 10 0b ba 00 1f 00 1e e9"): (self.generate_inet_upload, "", "BA-request: upload started"), # 0xBA request for inetBox to upload the buffer-frames
+            h("00 55 03 aa 0a ff ff ff ff ff ff 48"): (self.no_answer, "", "_ackn from CPplus"), # ackn from CPplus, also the reaction to B2
+            }
 
 
-    def _send_answer_w_cs_calc(self, databytes, pid_for_checksum=None):
-        if not pid_for_checksum:
-            cs = calculate_checksum(databytes)
-        else:
-            cs = calculate_checksum(bytes([pid_for_checksum]) + databytes)
-        self.send_answer(self, serial, databytes.extend([cs]))
+    def response_waiting(self):
+        return len(self.ts_response_buffer)
 
 
     def _send_answer(self, databytes):
         self.serial.write(databytes)
         self.serial.flush()
-        log.debug("out > " + str(databytes.hex(" ")))
+        if self.debug: log.debug(f"out > {databytes.hex(' ')}")
         self.pin_map.toggle_led("lin_led")
 
 
     def prepare_tl_str_response(self, message_str, info_str):
-        self.prepare_tl_response(bytes.fromhex(message_str.replace(" ","")))
+        self.prepare_tl_info_response(bytes.fromhex(message_str), info_str)
+
+
+    def prepare_tl_info_response(self, message, info_str):
+        self.prepare_tl_response(message)
         if info_str.startswith("_"):
-            log.debug(info_str)
+            if self.debug: log.debug(info_str)
         else:
             log.info(info_str)
 
@@ -124,7 +196,7 @@ class Lin:
             self.stop_async = self.response_waiting()
         self.updates_to_send = (self.app.upload_buffer or self.app.upload02_buffer)
         if p.startswith("_"): return
-        log.debug(p)
+        if self.debug: log.debug(p)
 
 
     def display_status(self):
@@ -138,22 +210,40 @@ class Lin:
 #            print()
 
 
+    # store a segment of a buffer download, the segments must arrive in order,
+    # otherwise the transfer is dropped - there is no stale data from the last transfer
+    def store_cpp_segment(self, seg, data):
+        if seg == 0:
+            self.cpp_segments = 0 # start of a new transfer
+        elif self.cpp_segments != (1 << seg) - 1:
+            if self.cpp_segments >= 0:
+                self.cnt_buffer_errors += 1
+                if self.debug: log.debug(f"buffer segment {seg + 1} out of order - transfer dropped")
+            self.cpp_segments = -1
+            return False
+        offs = seg * self.SEGMENT_SIZE
+        self.cpp_view[offs:offs + self.SEGMENT_SIZE] = data
+        self.cpp_segments |= 1 << seg
+        return True
+
+
     def assemble_cpp_buffer(self):
-        # gather the transfered frames
-        # preamble "00 1E 00 00 0x22 0xFF 0xFF 0x54 0x01"
+        # the transfered frames are already gathered in cpp_frame
+        # preamble "00 00 0x22 0xFF 0xFF 0xFF 0x54 0x01"
         # buffer id (2 bytes)
-        buf = bytes([])
-        for i in range(5):
-            buf += self.cpp_in_buffer[i]
-        #print(buf.hex("+"))
-        if buf[:8] != self.BUFFER_PREAMBLE:
+        if self.cpp_segments != self.BUFFER_COMPLETE:
+            return False
+        self.cpp_segments = 0
+        if not self.cpp_frame.startswith(self.BUFFER_PREAMBLE):
+            self.cnt_buffer_errors += 1
             log.debug("buffer preamble doesn't match")
             return False
-        buf_id = buf[8:10]
+        buf_id = bytes(self.cpp_frame[8:10])
         self.d8_alive = True
-        self.cpp_buffer[buf_id] = buf[10:]
-        log.debug(f"Buf[{buf_id}]={self.cpp_buffer[buf_id]}")
-        self.app.process_status_buffer_update(buf_id, self.cpp_buffer[buf_id])
+        if self.debug: log.debug(f"Buf[{buf_id}]={self.cpp_view[10:].hex(' ')}")
+        # the status buffer is handed over as view, it is only valid during the call
+        self.app.process_status_buffer_update(buf_id, self.cpp_view[10:])
+        self.app.commit_status()
         return True
 
 
@@ -169,27 +259,28 @@ class Lin:
 #         self.prepare_tl_response(bytes.fromhex("03 26 00 00 00 00 00 00 d6".replace(" ","")))
 
         if self.app.upload_buffer:
-            log.debug("heater_status to be generated")
+            if self.debug: log.debug("heater_status to be generated")
             self.cmd_buf = self.app._get_status_buffer_for_writing()
             self.stop_async = True
             if self.app.upload_buffer > 0: self.app.upload_buffer -= 1
 
         if self.app.upload02_buffer:
-            log.debug("aircon_status to be generated")
+            if self.debug: log.debug("aircon_status to be generated")
             self.cmd_buf = self.app._get_status_buffer1_for_writing()
             self.stop_async = True
             if self.app.upload02_buffer > 0: self.app.upload02_buffer -= 1
 
         if (self.cmd_buf == None) or (self.cmd_buf == {}):
-            log.debug("cmd_buffer is empty")
+            if self.debug: log.debug("cmd_buffer is empty")
             return
         self.d8_alive = True
         self.stop_async = True
+        # the frames are views of the encoder buffer - queue a snapshot
         for i in self.cmd_buf:
-            self.prepare_tl_response(i)
+            self.prepare_tl_response(bytes(i))
         self.updates_to_send = False
         if p.startswith("_"): return
-        log.debug(p)
+        if self.debug: log.debug(p)
 
     async def watchdog(self):
         log.info("watchdog activated")
@@ -212,105 +303,185 @@ class Lin:
                 #import machine
                 #machine.reset()
 
+    # snapshot of the metrics of the LIN side and the status decoding, see metrics.py
+    def metrics(self):
+        m = {
+            "frames": self.cnt_frames,
+            "d8_polls": self.cnt_d8,
+            "sync_lost": self.cnt_sync_lost,
+            "truncated": self.cnt_truncated,
+            "unknown_frames": self.cnt_unknown,
+            "buffer_errors": self.cnt_buffer_errors,
+            "assemble_failures": self.cnt_assemble_failures,
+            "d8_latency": self.d8_latency.snapshot(),
+        }
+        m.update(self.app.metrics())
+        return m
+
+
     # check alive status
     def status_monitor(self):
-        self.cnt_in += 1
-        if not(self.cnt_in % self.CNT_IN_MAX):
-            self.cnt_in=0
-            self.app.status["alive"] = ["ON", True, False]
+        now = monotonic()
+        if now - self.alive_ts >= self.ALIVE_PERIOD:
+            self.alive_ts = now
             # Same approach for the raw PID 0xD8. This corresponds to a PID 0x18
-            if self.d8_alive:
-                self.app.status["alive"][0] = "ON"
-            else:
-                self.app.status["alive"][0] = "OFF"
+            alive = "ON" if self.d8_alive else "OFF"
+            if self.app.status["alive"][0] != alive:
+                self.app.status["alive"] = [alive, True, False]
             self.d8_alive = False
+            self.app.commit_status()
             self.pin_map.set_led("lin_led", False)
 
 
+    # event driven receive: the serial port is registered with the asyncio loop, so the
+    # frame state machine only runs if bytes are arriving
+    # returns False for ports without a file descriptor (e.g. loop://) - these have to be polled
+    def attach_reader(self, loop):
+        try:
+            fd = self.serial.fileno()
+        except (AttributeError, OSError, ValueError):
+            return False
+        self.rx_event = asyncio.Event()
+        self.rx_fd = fd
+        loop.add_reader(fd, self._rx_ready)
+        log.debug(f"event driven receive on fd {fd}")
+        return True
+
+
+    def _rx_ready(self):
+        if not self.rx_event.is_set():
+            self.rx_ts = monotonic()
+            self.rx_event.set()
+
+
+    def detach_reader(self, loop):
+        if self.rx_fd is not None:
+            loop.remove_reader(self.rx_fd)
+        self.rx_fd = None
+        self.rx_event = None
+
+
+    # wait until the serial port is readable, at least until the next alive check
+    # or the timeout of an incomplete frame is due
+    async def wait_rx(self):
+        deadline = self.alive_ts + self.ALIVE_PERIOD
+        if self.rx_deadline is not None and self.rx_deadline < deadline:
+            deadline = self.rx_deadline
+        timeout = deadline - monotonic()
+        if timeout > 0 and not self.rx_event.is_set():
+            try:
+                await asyncio.wait_for(self.rx_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.rx_event.clear()
+
 
     async def loop_serial(self):
 
         self.status_monitor()
-        # New input process: idea is, nothing to forget. So there is a turing-machine nessecary. This read 1 byte and decide to switch in the next level or to throw the input away
+        # New input process: idea is, nothing to forget. All waiting bytes are collected in rx_buf
+        # and a turing-machine searches the sync byte, decides on the PID and waits for the rest of
+        # the frame. A frame, which is not completed in time is dropped - the search for the next
+        # sync byte continues behind the dropped sync byte
         # So there is a much higher probability for synchronizing
-        if not(self.serial.in_waiting):
-            return
-        self.pin_map.dtoggle_led("lin_led")
         ####### Many thanks to florent314 see also issue #69
-        #line = self.serial.read()
-        ##if self.loop_state: # this means level 2
-        ##    if line[0] == 0x55: # here it is clear, we saw a correct synchronizing
-        ##        line = bytes([0x00, 0x55]) + self.serial.read(1)
-        ##        self.loop_state = False
-        ##        # this is the exit point of the turing machine
-        ##    else: # recycling the byte, if it is 0x00
-        ##        self.loop_state = (line[0] == 0x00) # e.g. 0x00 0x00 0x55 would be found
-        ##        return
-        ##else: # this is level 1 - waiting for 0x00 for next level
-        ##    self.loop_state = (line[0] == 0x00)
-        ##    if not(self.loop_state):
-        ##        #if self.debug:
-        ##       print(f"in < {line[0]:02x} not a proper sync -wait for sync-")
-        ##        pass
-        ##    return
-        line = b'\x00'+ self.serial.read(1)
-        while(not line[1] == 0x55 ):
-            if self.serial.in_waiting == 0:
-                return
-            line = b'\x00'+ self.serial.read(1)
+        n = self.serial.in_waiting
+        if n:
+            if self.rx_fd is None: self.rx_ts = monotonic()
+            self.pin_map.dtoggle_led("lin_led")
+            self.rx_buf += self.serial.read(n)
+        while self.rx_buf and self._parse_frame():
+            pass
 
-        line += self.serial.read(1)
-        #line = self.serial.read(2)
 
-        #if(not len(line)==11 ):
-        #
-        #    return
+    # waiting for the rest of a frame, returns True if the frame is dropped
+    def _frame_timeout(self):
+        now = monotonic()
+        if self.rx_deadline is None:
+            self.rx_deadline = now + self.FRAME_TIMEOUT
+            return False
+        if now < self.rx_deadline:
+            return False
+        self.rx_deadline = None
+        self.cnt_truncated += 1
+        self.rx_slack = self.SYNC_SLACK_RESPONSE # the rest of the frame is skipped
+        if self.debug: log.debug(f"truncated frame dropped: {self.rx_buf.hex(' ')}")
+        del self.rx_buf[:1]
+        return True
 
-        raw_pid = line[2]
+
+    # process one frame out of rx_buf, returns False if more bytes are needed
+    def _parse_frame(self):
+        buf = self.rx_buf
+        i = buf.find(0x55)
+        if i < 0:
+            self.rx_skipped += len(buf)
+            buf.clear()
+            return False
+        if i:
+            self.rx_skipped += i
+            del buf[:i]
+        if self.rx_skipped:
+            if self.rx_skipped > self.rx_slack: self.cnt_sync_lost += 1
+            self.rx_skipped = 0
+        if len(buf) < 2:
+            return self._frame_timeout()
+
+        raw_pid = buf[1]
 
         #if raw_pid in self.DISPLAY_STATUS_PIDS: log.debug(f"status-message found with {raw_pid:x}") #0x20 0x61 0xe2
 
 # Same approach for the raw PID 0xD8. This corresponds to a PID 0x18
         if raw_pid == 0xd8:
+            del buf[:2]
+            self.rx_deadline = None
             self.d8_alive = True
-            self.app.status["alive"] = ["ON", True, False]
+            # the alive status is only flagged for mqtt, when it changes
+            if self.app.status["alive"][0] != "ON":
+                self.app.status["alive"] = ["ON", True, False]
+                self.app.commit_status()
             self.pin_map.set_led("lin_led", True)
-            log.debug(f"in1 < {line.hex(' ')}")
+            self.rx_slack = self.SYNC_SLACK_RESPONSE
+            self.cnt_frames += 1
+            self.cnt_d8 += 1
+            if self.debug: log.debug("in1 < 00 55 d8")
             s = False
             if not(self.app.upload_wait): s = (self.app.upload_buffer or self.app.upload02_buffer)
             if s:
                 self.app.upload_wait = 4
                 self.stop_async = True
-                log.debug("0x18 - update-requested")
-                self._send_answer(bytearray.fromhex("ff ff ff ff ff ff ff ff 27".replace(" ","")))
-                return
+                if self.debug: log.debug("0x18 - update-requested")
+                self._send_answer(RESP_D8_UPDATE)
             else:
-                self._send_answer(bytearray.fromhex("fe ff ff ff ff ff ff ff 28".replace(" ","")))
+                self._send_answer(RESP_D8_IDLE)
                 if self.app.upload_wait:
                     self.app.upload_wait -= 1
-                return
+            self.d8_latency.add(monotonic() - self.rx_ts)
+            return True
 # send requested answer to 0x3d -> 0x7d with parity) but only, if I have the need to answer
         if raw_pid == 0x7d:
+            del buf[:2]
+            self.rx_deadline = None
+            self.rx_slack = self.SYNC_SLACK_RESPONSE
+            self.cnt_frames += 1
             if self.response_waiting():
-                log.debug(f"in2 < {line.hex(' ')}")
+                if self.debug: log.debug("in2 < 00 55 7d")
                 self._answer_tl_request()
-                return
-            else: return
-
-        while self.serial.in_waiting < 9:
-            pass
-        #print("Debug:ici")
-
-        line += self.serial.read(9)
+            return True
+
+        # sync, pid and 9 bytes (8 data bytes + checksum)
+        if len(buf) < 11:
+            return self._frame_timeout()
+        line = b'\x00' + buf[:11]
+        del buf[:11]
+        self.rx_deadline = None
+        self.rx_slack = self.SYNC_SLACK_FRAME
+        self.cnt_frames += 1
+        self._process_frame(line)
+        return True
 
-        #deb=""
-        #for b in line:
-        #    deb=deb+f"{b:02x} "
-        #if(len(line)>2):
-        #    log.debug("%s, %d, 0x%x"%(deb,len(line),line[2]))
-        #else:
-        #    log.debug("%s, %d"%(deb,len(line)))
 
+    def _process_frame(self, line):
         # the idea is to trigger events from the loop-timing
         # seeing completed rows at this point (rows means LIN-frames)
         # but we don't use this functionality at the moment
@@ -318,45 +489,29 @@ class Lin:
         #self.cnt_rows = self.cnt_rows % self.CNT_ROWS_MAX
         #if not(self.cnt_rows): self.display_status()
 
-        log.debug(f"in3 < {line.hex(' ')}")
-#        if len(line) != 12:
-#            return              # exit, length isn't correct
-#
+        if self.debug: log.debug(f"in3 < {line.hex(' ')}")
 
 # most of the following comments are only used in the test-phase
 # so the idea was, to hide all comments with a begining underline
 
 
 # multi-frame receive for buffer download from CPplus
-        buf_trans_id = bytes([0x00, 0x55, 0x3c, 0x03])
-        if (line[:4]==buf_trans_id) and (line[4] in range(0x21, 0x27)):
+        if line.startswith(self.BUFFER_TRANSFER_ID) and (0x21 <= line[4] <= 0x26):
 #            self.("Buffer-check:" + str(line.hex("-")))
-            self.cpp_in_buffer[line[4] - 0x21] = line[5:-1] # fill into buffer-segment
-#            log.debug(str(self.cpp_in_buffer[line[4] - 0x21].hex("*"))+ str(line[4] - 0x21))
+            if not(self.store_cpp_segment(line[4] - 0x21, line[5:-1])): # fill into buffer-segment
+                return
             if (line[4] == 0x26):
                 if (self.assemble_cpp_buffer()):
-                    self.prepare_tl_str_response("03 01 fb ff ff ff ff ff 00", "_send ackn-response for buffer delivery") # ackn buffer-upload
+                    self.prepare_tl_info_response(RESP_BUFFER_ACKN, "_send ackn-response for buffer delivery") # ackn buffer-upload
+                else:
+                    self.cnt_assemble_failures += 1
                 return # Line is stored in buffer - nothing else to do
             else:
                 return
 
-        cmd = line.hex(" ")
-# single frame messages - answers to send buffer
-# comments could be set "unshow" in info-log with a starting underline
-# attention: this are raw frames with checksum -> see specification for details
-        cmd_ctrl = {
-            "00 55 3c 7f 06 b2 00 17 46 00 1f 4b": [self.prepare_tl_str_response, "03 06 f2 17 46 00 1f 00 87", "_B2 - response request"],  # B2-Message I - Initialization started
-            "00 55 03 aa 0a ff ff ff ff ff ff 48": [self.no_answer, "", "_NAD 03 response - ack"],               # reaction to B2 - ackn
-            "00 55 3c 03 06 b2 20 17 46 00 1f a7": [self.prepare_tl_str_response, "03 06 f2 17 46 00 1f 00 87", "B2 - identifier for NAD 03"],  # B2-Message II: Looking for my ID-no 17 46 00 1f
-            "00 55 3c 03 06 b2 22 17 46 00 1f a5": [self.prepare_tl_str_response, "03 06 f2 17 46 00 1f 00 87", "B2 - initializer for NAD 03   -----------------> start registration"],  # B2-Message Initializer
-            "00 55 3c 7f 06 b0 17 46 00 1f 03 4a": [self.prepare_tl_str_response, "03 01 f0 ff ff ff ff ff 0b", "B0 - init finalized - send ackn ---------------> registration finalized"],  # B0-Message - registation finalized
-            "00 55 3c 03 05 b9 00 1f 00 00 ff 1f": [self.prepare_tl_str_response, "03 02 f9 00 ff ff ff ff 01", "_Heartbeat for NAD 03 - send response"],  # Heartbeat
-            "00 55 3c 03 10 29 bb 00 1f 00 1e ca": [self.no_answer, "", "_Frame 1 of buffer-transfer (6 frames) from CPplus"], #0xBB notice to send buffer
-            "00 55 3c 03 10 0b ba 00 1f 00 1e e9": [self.generate_inet_upload, "", "BA-request: upload started"], # 0xBA request for inetBox to upload the buffer-frames
-            "00 55 03 aa 0a ff ff ff ff ff ff 48": [self.no_answer, "", "_ackn from CPplus"], # ackn from CPplus
-            }
-        if not(cmd in cmd_ctrl.keys()):
+        cmd = self.frame_dispatch.get(line)
+        if cmd is None:
             #log.debug(str(line.hex(" ")) + "-> no processing")
+            self.cnt_unknown += 1
             return # no processing necessary
-        cmd_ctrl[cmd][0](cmd_ctrl[cmd][1], cmd_ctrl[cmd][2]) # do it
-        return
+        cmd[0](cmd[1], cmd[2]) # do it
@@ -0,0 +1,319 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# LIN master simulator: plays the role of the Truma CP Plus, so inetbox2mqtt can be run and
+# load tested without the heater
+#
+# The simulator sends the traffic of the CP Plus in LIN schedule slots: the B2/B0 registration
+# sequence, 0x18 polls (raw PID 0xD8), heartbeats and status buffer downloads as 0x3C transport
+# frames, and 0x3D polls (raw PID 0x7D) for the answers of the inetbox. Whenever the inetbox
+# requests an update, it is asked to upload its buffer (0xBA request). All answers are checked:
+# the canned responses must match, the uploaded frames must have a valid checksum, sequence and
+# buffer checksum. The results are counted in LinMaster.stats.
+#
+# There are two ways to connect the simulator:
+#   - a pseudo terminal: python3 src/linsim.py creates it and prints its path, which is set as
+#     [serial] device of a running inetbox2mqtt (--device also takes a pyserial URL or a real
+#     serial port with a LIN transceiver)
+#   - in process: python3 src/linsim.py --local runs a Lin instance on a loop:// port, which is
+#     shared with the simulator like the single-wire bus; the Lin instance is stepped after each
+#     header, so with --slot 0 the parser runs as fast as possible
+#
+# Examples:
+#   python3 src/linsim.py --cycles 100
+#   python3 src/linsim.py --local --slot 0 --cycles 1000 --command target_temp_room=20
+#
+
+import os
+import sys
+import tty
+import fcntl
+import struct
+import termios
+import asyncio
+import logging
+import argparse
+from time import monotonic
+
+import checksum
+
+log = logging.getLogger(__name__)
+
+# LIN frame timing at 9600 baud: the slot of a frame with 8 data bytes must hold the maximum frame
+# length of 1.4 * (34 + 10 * (8 + 1)) bit times (12.25 ms), the schedule uses a 5 ms time base
+SLOT_TIME = 0.015
+BYTE_TIME = 10 / 9600
+# the answer of the inetbox passes the USB serial converter (FT232R latency timer 16 ms)
+RESPONSE_TIMEOUT = 0.030
+
+D8_POLL = bytes.fromhex("00 55 d8")
+POLL_3D = bytes.fromhex("00 55 7d")
+
+# master request frames (sync, PID 0x3C, 8 data bytes, checksum) and the expected answers
+# (see Lin._build_frame_dispatch)
+REGISTRATION = [
+    (bytes.fromhex("00 55 3c 7f 06 b2 00 17 46 00 1f 4b"), bytes.fromhex("03 06 f2 17 46 00 1f 00 87")),
+    (bytes.fromhex("00 55 3c 03 06 b2 20 17 46 00 1f a7"), bytes.fromhex("03 06 f2 17 46 00 1f 00 87")),
+    (bytes.fromhex("00 55 3c 03 06 b2 22 17 46 00 1f a5"), bytes.fromhex("03 06 f2 17 46 00 1f 00 87")),
+    (bytes.fromhex("00 55 3c 7f 06 b0 17 46 00 1f 03 4a"), bytes.fromhex("03 01 f0 ff ff ff ff ff 0b")),
+]
+HEARTBEAT      = (bytes.fromhex("00 55 3c 03 05 b9 00 1f 00 00 ff 1f"), bytes.fromhex("03 02 f9 00 ff ff ff ff 01"))
+BUFFER_NOTICE  = bytes.fromhex("00 55 3c 03 10 29 bb 00 1f 00 1e ca")
+BUFFER_ACKN    = bytes.fromhex("03 01 fb ff ff ff ff ff 00")
+UPLOAD_REQUEST = bytes.fromhex("00 55 3c 03 10 0b ba 00 1f 00 1e e9")
+UPLOAD_ACKN    = bytes.fromhex("00 55 03 aa 0a ff ff ff ff ff ff 48")
+RESP_D8_UPDATE = bytes.fromhex("ff ff ff ff ff ff ff ff 27")
+RESP_D8_IDLE   = bytes.fromhex("fe ff ff ff ff ff ff ff 28")
+
+BUFFER_PREAMBLE = bytes([0x00, 0x00, 0x22, 0xFF, 0xFF, 0xFF, 0x54, 0x01])
+UPLOAD_FIRST_FRAME = bytes.fromhex("03 10 29 fa 00 1f 00 1e 8b")
+UPLOAD_IDS = (bytes([0x0C, 0x32]), bytes([0x0C, 0x34]))
+
+# status buffers of the CP Plus, as recorded on a Truma Combi 4
+STATUS_BUFFERS = [
+    (bytes([0x14, 0x33]), bytes.fromhex("00 2a 8e 0b 01 00 84 03 58 0d 84 03 01 01 4d 0b 9b 0b 00 00 00 00 00 00 00 00")),
+    (bytes([0x18, 0x3D]), bytes.fromhex("00 94 8e 0b 00 00 00 00 58 0d 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00")),
+    (bytes([0x0A, 0x15]), bytes.fromhex("00 32 0d 11 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00")),
+    (bytes([0x12, 0x35]), bytes.fromhex("00 de 00 00 72 00 ae 0b 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00")),
+]
+
+# 0x18 polls between two transfers of the schedule
+D8_POLLS = 2
+
+
+# frames of a status buffer download: 0xBB notice and 6 segments with 6 bytes each
+def buffer_download(buf_id, data):
+    payload = (BUFFER_PREAMBLE + buf_id + data).ljust(36, b"\0")
+    frames = [BUFFER_NOTICE]
+    for i in range(6):
+        body = bytes([0x03, 0x21 + i]) + payload[i * 6:i * 6 + 6]
+        frames.append(bytes([0x00, 0x55, 0x3C]) + body + bytes([checksum.classic(body)]))
+    return frames
+
+
+# master side of a pseudo terminal, with the interface of a pyserial port
+class PtyPort:
+
+    def __init__(self):
+        self.fd, self.slave_fd = os.openpty()
+        tty.setraw(self.fd)
+        tty.setraw(self.slave_fd)
+        self.name = os.ttyname(self.slave_fd)
+
+    @property
+    def in_waiting(self):
+        return struct.unpack("i", fcntl.ioctl(self.fd, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+    def read(self, n=1):
+        return os.read(self.fd, n)
+
+    def write(self, data):
+        return os.write(self.fd, data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.slave_fd)
+
+
+class LinMaster:
+
+    def __init__(self, port, lin=None, slot_time=SLOT_TIME, byte_time=0, response_timeout=RESPONSE_TIMEOUT):
+        self.port = port
+        self.lin = lin            # Lin instance sharing the port, stepped after each header
+        self.slot_time = slot_time
+        self.byte_time = byte_time  # > 0: the bytes are written one by one at this pace
+        self.response_timeout = response_timeout
+        self.buffers = list(STATUS_BUFFERS)
+        self.update_requested = False
+        self.uploads = []         # (buffer id, status buffer) uploaded by the inetbox
+        self.slot_start = None
+        self.stats = {"frames": 0, "responses": 0, "errors": 0, "missing": 0, "updates": 0, "uploads": 0}
+
+    def error(self, msg):
+        self.stats["errors"] += 1
+        log.warning(msg)
+
+    # wait for the start of the next schedule slot
+    async def _slot(self):
+        if self.slot_start is None:
+            self.slot_start = monotonic()
+        else:
+            self.slot_start += self.slot_time
+            delay = self.slot_start - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.slot_start = monotonic() # overrun, e.g. with --slot 0
+                await asyncio.sleep(0)
+
+    async def _write(self, frame):
+        await self._slot()
+        self.stats["frames"] += 1
+        if self.byte_time:
+            for i in range(len(frame)):
+                self.port.write(frame[i:i+1])
+                await asyncio.sleep(self.byte_time)
+        else:
+            self.port.write(frame)
+        self.port.flush()
+
+    # read the 9 bytes of a slave response, fewer if it doesn't come in time
+    async def _response(self):
+        data = bytearray()
+        deadline = monotonic() + self.response_timeout
+        while True:
+            if self.lin is not None:
+                await self.lin.loop_serial()
+            n = self.port.in_waiting
+            if n:
+                data += self.port.read(n)
+            if len(data) >= 9 or self.lin is not None or monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.001)
+        if len(data) > 9:
+            self.error(f"response too long: {data.hex(' ')}")
+        return bytes(data)
+
+    # master request frame without a response
+    async def send(self, frame):
+        await self._write(frame)
+        if self.lin is not None:
+            await self.lin.loop_serial()
+        # a master request is never answered directly
+        if self.port.in_waiting:
+            self.error(f"unexpected bytes after {frame.hex(' ')}: {self.port.read(self.port.in_waiting).hex(' ')}")
+
+    # header of a slave response frame, returns the response
+    async def poll(self, header, expected=None):
+        await self._write(header)
+        response = await self._response()
+        if not response:
+            if expected is not None:
+                self.stats["missing"] += 1
+                log.warning(f"no response to {header.hex(' ')}, expected {expected.hex(' ')}")
+            return response
+        self.stats["responses"] += 1
+        if expected is not None and response != expected:
+            self.error(f"response to {header.hex(' ')}: {response.hex(' ')}, expected {expected.hex(' ')}")
+        return response
+
+    async def poll_d8(self):
+        response = await self.poll(D8_POLL)
+        if response == RESP_D8_UPDATE:
+            self.stats["updates"] += 1
+            self.update_requested = True
+        elif response != RESP_D8_IDLE:
+            self.error(f"response to the 0x18 poll: {response.hex(' ')}")
+
+    async def registration(self):
+        for frame, expected in REGISTRATION:
+            await self.send(frame)
+            await self.poll(POLL_3D, expected)
+        await self.poll_d8()
+
+    async def heartbeat(self):
+        frame, expected = HEARTBEAT
+        await self.send(frame)
+        await self.poll(POLL_3D, expected)
+
+    async def download(self, buf_id, data):
+        for frame in buffer_download(buf_id, data):
+            await self.send(frame)
+        await self.poll(POLL_3D, BUFFER_ACKN)
+
+    # ask the inetbox for the buffer it wants to upload and check it
+    async def upload(self):
+        self.update_requested = False
+        await self.send(UPLOAD_REQUEST)
+        frames = []
+        for i in range(7):
+            frames.append(await self.poll(POLL_3D))
+        await self.send(UPLOAD_ACKN)
+        if frames[0] != UPLOAD_FIRST_FRAME:
+            self.error(f"first upload frame: {frames[0].hex(' ')}")
+            return
+        payload = bytearray()
+        for i, frame in enumerate(frames[1:]):
+            if len(frame) != 9 or frame[0] != 0x03 or frame[1] != 0x21 + i or checksum.classic(frame[:8]) != frame[8]:
+                self.error(f"upload frame {i + 2}: {frame.hex(' ')}")
+                return
+            payload += frame[2:8]
+        buf_id = bytes(payload[8:10])
+        if not payload.startswith(BUFFER_PREAMBLE) or buf_id not in UPLOAD_IDS or checksum.classic(payload[6:]):
+            self.error(f"uploaded buffer: {payload.hex(' ')}")
+            return
+        self.stats["uploads"] += 1
+        self.uploads.append((buf_id, bytes(payload[10:])))
+        log.info(f"upload {buf_id.hex(' ')}: {payload[10:].hex(' ')}")
+
+    # one cycle of the schedule: heartbeat and all status buffers, with 0x18 polls in between
+    async def cycle(self):
+        for i in range(D8_POLLS):
+            await self.poll_d8()
+        await self.heartbeat()
+        for buf_id, data in self.buffers:
+            for i in range(D8_POLLS):
+                await self.poll_d8()
+                if self.update_requested:
+                    await self.upload()
+            await self.download(buf_id, data)
+
+    async def run(self, cycles):
+        await self.registration()
+        for i in range(cycles):
+            await self.cycle()
+        return self.stats
+
+
+async def main(args):
+    lin = None
+    if args.local:
+        import serial as pyserial
+        from tools import PIN_MAP, PIN_MAPS
+        from lin import Lin
+        port = pyserial.serial_for_url("loop://", baudrate=9600, timeout=0)
+        lin_port = port
+        if args.capture:
+            from capture import RecordingSerial
+            lin_port = RecordingSerial(port, args.capture)
+        lin = Lin(lin_port, PIN_MAP(PIN_MAPS["RPi"]), args.debug, args.debug)
+        for command in args.command:
+            key, value = command.split("=", 1)
+            lin.app.set_status(key, value)
+    elif args.device:
+        import serial as pyserial
+        port = pyserial.serial_for_url(args.device, baudrate=9600, timeout=0)
+    else:
+        port = PtyPort()
+        print(f"LIN master on {port.name}, set it as [serial] device of inetbox2mqtt")
+        await asyncio.sleep(args.wait)
+    master = LinMaster(port, lin, args.slot / 1000, args.byte_time / 1000)
+    t0 = monotonic()
+    stats = await master.run(args.cycles)
+    t = monotonic() - t0
+    if lin is not None and args.capture:
+        lin.serial.close()
+    print(" ".join(f"{key}={value}" for key, value in stats.items()) + f" time={t:.3f}s frames/s={stats['frames'] / t:.0f}")
+    return 1 if stats["errors"] or (stats["missing"] and lin is not None) else 0
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+    parser = argparse.ArgumentParser(description="LIN master simulator (Truma CP Plus)")
+    parser.add_argument("--device", help="serial port or pyserial URL instead of a pseudo terminal")
+    parser.add_argument("--local", action="store_true", help="run an in-process Lin on loop://")
+    parser.add_argument("--cycles", type=int, default=10, help="schedule cycles (default 10)")
+    parser.add_argument("--slot", type=float, default=SLOT_TIME * 1000, help="slot time in ms (default %(default)s)")
+    parser.add_argument("--byte-time", type=float, default=0, help=f"write the bytes one by one, ms per byte (real bus: {BYTE_TIME * 1000:.2f})")
+    parser.add_argument("--wait", type=float, default=30, help="seconds to wait for inetbox2mqtt on the pseudo terminal")
+    parser.add_argument("--command", action="append", default=[], help="key=value set command for --local")
+    parser.add_argument("--capture", help="record the traffic of the Lin instance of --local into this file")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(asctime)s [%(name)s] %(levelname)s: %(message)s', stream=sys.stdout)
+    sys.exit(asyncio.run(main(args)))
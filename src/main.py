@@ -31,9 +31,16 @@
 
 import os
 import sys
+import json
+import time
 import logging
 import asyncio
 from lin import Lin
+from state_export import StateExport
+from status_shm import StatusShm
+from dbus_export import DbusExport
+from capture import RecordingSerial
+import metrics
 import serial as pyserial
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -53,7 +60,26 @@ log = logging.getLogger(__name__)
 # Global objects
 connect = None
 lin     = None
-lock    = None
+export  = None
+shm     = None
+dbus    = None
+
+# LIN receive mode: "event" registers the serial port with the asyncio loop,
+# "poll" checks the port every 1ms
+RX_MODE = "poll"
+
+
+# Status changes are published after PUBLISH_DEBOUNCE seconds, so the values of the
+# status buffers of one CPplus cycle go out together; all values are published again
+# every HEARTBEAT_INTERVAL seconds, e.g. for late subscribers
+PUBLISH_DEBOUNCE   = 0.2
+HEARTBEAT_INTERVAL = 60
+
+
+# The LIN metrics (see metrics.py) are published every METRICS_INTERVAL seconds (0: off) and
+# served as JSON on the local TCP port METRICS_PORT (None: off)
+METRICS_INTERVAL = 60
+METRICS_PORT     = None
 
 
 # Release number
@@ -64,13 +90,14 @@ REL_NO = "3.0.0"
 TOPIC_ROOT = 'truma'
 SET_PREFIX = 'service/' + TOPIC_ROOT + '/set/'
 STA_PREFIX = 'service/' + TOPIC_ROOT + '/control_status/'
+STA_TOPICS = {}  # encoded status topic per key
+MET_PREFIX = 'service/' + TOPIC_ROOT + '/metrics/'
 
 
 
 # Universal callback function for all subscriptions
 async def callback(topic, msg, retained, qos):
     global connect
-    global lock
 
     log.debug(f"received: {topic}: {msg}")
     topic = str(topic)
@@ -82,11 +109,10 @@ async def callback(topic, msg, retained, qos):
         topic = topic[len(SET_PREFIX):]
         if topic in lin.app.status.keys():
             log.info("inet-key:"+str(topic)+" value:"+str(msg))
-            async with lock:
-                try:
-                    lin.app.set_status(topic, msg)
-                except Exception as e:
-                    log.debug(Exception(e))
+            try:
+                lin.app.set_status(topic, msg)
+            except Exception as e:
+                log.debug(Exception(e))
         else:
             log.debug("key is unknown")
 
@@ -99,38 +125,54 @@ async def conn_callback(client):
 
 
 
-# Write a key-value pair to a file in the tmp folder for use by other scripts
-def write_to_file(key, value):
-    dir_path = "/tmp/truma"
-    os.makedirs(dir_path, exist_ok=True)
-    file_path = os.path.join(dir_path, key)
-    with open(file_path, 'w') as f:
-        f.write(str(value) + '\n')
-
-
-
 # main publisher-loop
 async def main():
     global connect
-    global lock
 
     log.debug("main-loop is running")
 
-    i = 0
+    event = lin.app.status_event = asyncio.Event()
+    if lin.app.committed_status: event.set() # committed before the (re)start of the loop
+    heartbeat = time.monotonic()
     wd = False
     while True:
-        await asyncio.sleep(8)      # Set the update interval (seconds)
-        async with lock:
-            await asyncio.sleep(2)  # Wait to ensure the status buffer has been updated
-            s = lin.app.get_all(True)
-
+        # wait for a committed status change, at the latest until the heartbeat is due
+        try:
+            await asyncio.wait_for(event.wait(), max(heartbeat + HEARTBEAT_INTERVAL - time.monotonic(), 0))
+            await asyncio.sleep(PUBLISH_DEBOUNCE)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+        if time.monotonic() - heartbeat >= HEARTBEAT_INTERVAL:
+            heartbeat = time.monotonic()
+            lin.app.flag_all_status() # publish all values with the alive-heartbeat every min, also for late subscribers
+            lin.app.commit_status()
+            event.clear()
+
+        # the values committed by the LIN side and the set commands since the last cycle,
+        # taking them doesn't block any of the writers
+        version, s = lin.app.take_status()
+        if s: log.debug(f"status version {version}")
+
+        batch = []
         for key in s.keys():
             log.debug(f'publish {key}:{s[key]}')
-            write_to_file(key, s[key])
-            try:
-                await connect.client.publish(STA_PREFIX+key, str(s[key]), qos=1)
-            except:
-                log.debug("Error in LIN status publishing")
+            topic = STA_TOPICS.get(key)
+            if topic is None:
+                topic = STA_TOPICS[key] = (STA_PREFIX+key).encode()
+            batch.append((topic, str(s[key])))
+        # one snapshot file for the other scripts on the device, skipped if nothing changed
+        if export is not None:
+            export.update(s)
+        if shm is not None and s:
+            shm.update(s)
+        if dbus is not None and s:
+            dbus.update(s)
+        # all changed keys go out in one write, the PUBACKs are awaited together
+        try:
+            await connect.client.publish_many(batch, qos=1)
+        except:
+            log.debug("Error in LIN status publishing")
         if lin.app.status["alive"][0]=="OFF":
             if not(wd):
                 log.info("LIN disconnected!")
@@ -141,16 +183,32 @@ async def main():
                 log.info("LIN connected")
                 wd = False
 
-        i += 1
-        if not(i % 6):
-            i = 0
-            lin.app.status["alive"][1] = True # publish alive-heartbeat every min
+
+# metrics publisher, the histograms go out as JSON
+async def metrics_loop():
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        batch = []
+        for key, value in lin.metrics().items():
+            batch.append(((MET_PREFIX+key).encode(), json.dumps(value) if isinstance(value, dict) else str(value)))
+        try:
+            await connect.client.publish_many(batch)
+        except:
+            log.debug("Error in metrics publishing")
 
 
 # major ctrl loop for inetbox-communication
 async def lin_loop():
     global lin
     await asyncio.sleep(1) # Delay at begin
+    if RX_MODE == "event" and lin.attach_reader(asyncio.get_running_loop()):
+        log.info("lin-loop is running (event driven)")
+        try:
+            while True:
+                await lin.wait_rx()
+                await lin.loop_serial()
+        finally:
+            lin.detach_reader(asyncio.get_running_loop())
     log.info("lin-loop is running")
     while True:
         await lin.loop_serial()
@@ -159,11 +217,16 @@ async def lin_loop():
 
 
 async def ctrl_loop():
-    global lock
-    lock = asyncio.Lock()
-
     a=asyncio.create_task(main())
     b=asyncio.create_task(lin_loop())
+    c=None
+    if METRICS_INTERVAL > 0:
+        c=asyncio.create_task(metrics_loop())
+    if METRICS_PORT is not None:
+        try:
+            await metrics.serve(METRICS_PORT, lin.metrics)
+        except OSError as e:
+            log.error(f"Failed to start the metrics endpoint: {e}")
 
     # Delay to ensure successful MQTT connect after boot
     await asyncio.sleep(20)
@@ -177,12 +240,23 @@ async def ctrl_loop():
         if b.done():
             log.info("Restart lin_loop")
             b=asyncio.create_task(lin_loop())
+        if c is not None and c.done():
+            log.info("Restart metrics_loop")
+            c=asyncio.create_task(metrics_loop())
 
 
 def run(w, lin_debug=False, inet_debug=False, mqtt_debug=False):
     global TOPIC_ROOT
+    global RX_MODE
+    global PUBLISH_DEBOUNCE
+    global HEARTBEAT_INTERVAL
+    global METRICS_INTERVAL
+    global METRICS_PORT
     global connect
     global lin
+    global export
+    global shm
+    global dbus
     connect = w
 
     lin_debug  = connect.config.getboolean("logging", "lin_debug")
@@ -197,6 +271,14 @@ def run(w, lin_debug=False, inet_debug=False, mqtt_debug=False):
 
     port = connect.config["serial"]["device"]
     log.info(f"device = {port}")
+    RX_MODE = connect.config["serial"].get("receive", RX_MODE)
+    log.info(f"receive mode = {RX_MODE}")
+    PUBLISH_DEBOUNCE   = connect.config.getfloat("mqtt", "publish_debounce", fallback=PUBLISH_DEBOUNCE)
+    HEARTBEAT_INTERVAL = connect.config.getfloat("mqtt", "heartbeat", fallback=HEARTBEAT_INTERVAL)
+    METRICS_INTERVAL   = connect.config.getfloat("metrics", "interval", fallback=METRICS_INTERVAL)
+    metrics_port = connect.config.get("metrics", "port", fallback="")
+    if metrics_port != "":
+        METRICS_PORT = int(metrics_port)
 
     if port == "dummy":
         serial = pyserial.serial_for_url('loop://', baudrate=9600)
@@ -210,8 +292,40 @@ def run(w, lin_debug=False, inet_debug=False, mqtt_debug=False):
             timeout=3
         )
 
+    # Record the LIN traffic, see capture.py
+    capture = connect.config["serial"].get("capture", "")
+    if capture != "":
+        max_size = connect.config.getfloat("serial", "capture_max", fallback=50) * 1000000
+        serial = RecordingSerial(serial, capture, max_size=int(max_size))
+
+    # Status export for other scripts, e.g. RpiTemperature.py
+    export_path = connect.config.get("export", "path", fallback="/tmp/truma/status.json")
+    if export_path != "":
+        compat_dir = connect.config.get("export", "per_key_dir", fallback="") or None
+        export = StateExport(export_path, compat_dir)
+        log.info(f"status export: {export_path}" + (f", per key: {compat_dir}" if compat_dir else ""))
+
     # Initialize the lin-object
     lin = Lin(serial, w.p, lin_debug, inet_debug)
+
+    # Status values in shared memory for local readers, see status_shm.py
+    shm_path = connect.config.get("export", "shm", fallback="")
+    if shm_path != "":
+        try:
+            shm = StatusShm(shm_path, lin.app.STATUS_CONVERSION_FUNCTIONS)
+            log.info(f"status shared memory: {shm_path}")
+        except OSError as e:
+            log.error(f"Failed to create status shared memory: {e}")
+
+    # Truma services on the Venus OS D-Bus, instead of the Truma part of RpiTemperature.py
+    if connect.config.getboolean("dbus", "enabled", fallback=False):
+        try:
+            dbus = DbusExport()
+            dbus.start()
+        except Exception as e:
+            log.error(f"Failed to start the D-Bus export: {e}")
+            dbus = None
+
     if connect.config["mqtt"]["topic"] != "":
         TOPIC_ROOT = connect.options["mqtt"]["topic"]
 
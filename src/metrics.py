@@ -0,0 +1,58 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Health metrics of the LIN side (see the [metrics] section of the config file)
+#
+# Lin and InetboxApp count frames, sync losses, dropped frames, buffer errors etc. in plain
+# integer attributes (cnt_...), latencies go into histograms with fixed buckets, whose counts are
+# preallocated. Recording a value is a bisect and an increment, nothing is allocated or
+# formatted on the hot path. Lin.metrics() takes a snapshot for the MQTT publisher and the local
+# endpoint.
+#
+# The local endpoint answers every TCP connection with the snapshot as one line of JSON:
+#     nc localhost 8765
+#
+
+import json
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets in seconds, the last bucket counts everything above
+LATENCY_BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05)
+
+
+class Histogram:
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = array("L", [0]) * (len(bounds) + 1)
+
+    # count a value, it goes into the first bucket with value <= bound
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    # bucket bounds in ms, the last count is above the last bound
+    def snapshot(self):
+        return {"le_ms": [round(b * 1000, 3) for b in self.bounds], "counts": self.counts.tolist()}
+
+
+# serve the snapshots of get_snapshot() on a local TCP port, returns the asyncio server
+async def serve(port, get_snapshot, host="127.0.0.1"):
+
+    async def client(reader, writer):
+        try:
+            writer.write(json.dumps(get_snapshot()).encode() + b"\n")
+            await writer.drain()
+        except (ConnectionError, OSError) as e:
+            log.debug(f"metrics endpoint: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    log.info(f"metrics endpoint on {host}:{port}")
+    return server
@@ -0,0 +1,72 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Export of the status values for other scripts on the device, e.g. RpiTemperature.py
+#
+# All values are kept in one compact JSON snapshot file (/tmp/truma/status.json by default),
+# which is rewritten as a whole through a temp file and os.replace(), so readers either see
+# the previous or the new snapshot, never a partly written one. Nothing is written if none of
+# the values has changed.
+# For scripts reading the former per-key files (/tmp/truma/<key>), these can still be written
+# in addition to the snapshot by passing their directory as compat_dir.
+#
+
+import os
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class StateExport:
+
+    def __init__(self, path="/tmp/truma/status.json", compat_dir=None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.compat_dir = compat_dir
+        self.state = {}  # all exported values
+        self.writes = 0  # files written, for the benchmarks
+
+    # merge the changed values into the snapshot and write it, returns True if written
+    def update(self, changes):
+        changed = {key: value for key, value in changes.items() if key not in self.state or self.state[key] != value}
+        if not changed:
+            return False
+        self.state.update(changed)
+        try:
+            self._write()
+            if self.compat_dir is not None:
+                for key, value in changed.items():
+                    self._write_key(key, value)
+        except OSError as e:
+            log.warning(f"state export: {e}")
+            return False
+        return True
+
+    # read a snapshot, returns an empty dict if there is none (yet)
+    @staticmethod
+    def read(path="/tmp/truma/status.json"):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _open(self, path):
+        try:
+            return open(path, "w")
+        except FileNotFoundError: # the directory is created on the first write, or it was cleaned up
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return open(path, "w")
+
+    def _write(self):
+        with self._open(self.tmp_path) as f:
+            f.write(json.dumps(self.state, separators=(",", ":")))
+        os.replace(self.tmp_path, self.path)
+        self.writes += 1
+
+    def _write_key(self, key, value):
+        with self._open(os.path.join(self.compat_dir, key)) as f:
+            f.write(str(value) + '\n')
+        self.writes += 1
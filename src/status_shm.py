@@ -0,0 +1,195 @@
+# MIT License
+#
+# Copyright (c) 2025  Karim Hraibi
+#
+# Status values in a shared memory segment (a file under /dev/shm), for local readers like
+# the Venus OS D-Bus bridges, which can then read them without any syscall or parsing.
+#
+# Layout, little endian:
+#     header  16 bytes: magic "TRMA", layout version (u16), number of slots (u16),
+#                       sequence counter (u32), layout generation (u32)
+#     slots   64 bytes each: key (32 bytes, NUL padded), value as number (f64, NaN if the
+#                       value isn't numeric), value as text (16 bytes, UTF-8, NUL padded),
+#                       CRC32 of number and text (u32), padding (4 bytes)
+# There is one slot for each key of InetboxApp.STATUS_CONVERSION_FUNCTIONS, in sorted order.
+#
+# The sequence counter works as a seqlock: the (single) writer makes it odd before changing
+# any slot and even again afterwards. A reader reads the counter, copies the values, and reads
+# the counter again; the copy is consistent if both counts are equal and even. Any number of
+# readers in other processes can map the segment read-only.
+# Python has no memory barriers, so on weakly ordered CPUs like the ARM of the Raspberry Pi a
+# reader may see the stores of the writer in another order than they were made. Therefore each
+# slot carries a CRC of its value, which the readers check: a single value is never torn, the
+# seqlock only keeps several values of one update together (best effort on ARM). The writer
+# updates the segment a few times per CPplus cycle at most, a reader which meets an update
+# retries, and backs off with short sleeps if the update takes longer.
+#
+# A restarted writer continues the sequence and counts the layout generation up, the readers
+# then read the slot table again. The segment is never shrunk, so the mapping of a reader stays
+# valid until then.
+#
+
+import os
+import mmap
+import math
+import time
+import zlib
+import struct
+import logging
+
+log = logging.getLogger(__name__)
+
+MAGIC   = b"TRMA"
+VERSION = 2
+HEADER  = struct.Struct("<4sHHII")
+SEQ     = struct.Struct("<I")
+SEQ_POS = 8
+SLOT    = struct.Struct("<32s28s4x")
+VALUE   = struct.Struct("<d16s") # followed by the CRC
+CRC     = struct.Struct("<I")
+SPINS   = 100    # reads before a reader starts to sleep while the writer is busy
+BACKOFF = 0.0001 # first sleep, doubled up to 10ms
+TIMEOUT = 1.0    # seconds, the writer is considered to be dead then
+
+
+def _value(number, text):
+    data = VALUE.pack(number, text)
+    return data + CRC.pack(zlib.crc32(data))
+
+
+class StatusShm:
+
+    def __init__(self, path, keys):
+        self.path = path
+        self.keys = sorted(keys)
+        self.slots = {key: HEADER.size + i * SLOT.size for i, key in enumerate(self.keys)}
+        size = HEADER.size + len(self.keys) * SLOT.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        # continue the sequence and the layout generation of a previous writer
+        magic, version, count, seq, generation = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            seq = generation = 0
+        self.seq = seq | 1
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, len(self.keys), self.seq, (generation + 1) & 0xFFFFFFFF)
+        empty = _value(math.nan, b"")
+        for key, pos in self.slots.items():
+            SLOT.pack_into(self.mm, pos, key.encode(), empty)
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_POS, self.seq)
+
+    # write the changed values, keys without a slot are ignored
+    def update(self, changes):
+        mm = self.mm
+        SEQ.pack_into(mm, SEQ_POS, self.seq + 1)
+        for key, value in changes.items():
+            pos = self.slots.get(key)
+            if pos is None:
+                continue
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = math.nan
+            text = str(value).encode()
+            if len(text) > 16: # cut on a character boundary
+                text = text[:16].decode(errors="ignore").encode()
+            mm[pos + 32:pos + 60] = _value(number, text)
+        self.seq += 2
+        SEQ.pack_into(mm, SEQ_POS, self.seq)
+
+    def close(self):
+        self.mm.close()
+
+
+class StatusShmReader:
+
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+        if not self._map():
+            raise ValueError(f"{path} is no status segment of version {VERSION}")
+
+    # map the segment and read the slot table, False if there is no consistent layout
+    def _map(self):
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for wait in self._waits():
+            if len(mm) < HEADER.size:
+                break
+            magic, version, count, seq, generation = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION or len(mm) < HEADER.size + count * SLOT.size:
+                break
+            if seq & 1:
+                continue
+            slots = {}
+            for i in range(count):
+                pos = HEADER.size + i * SLOT.size
+                slots[SLOT.unpack_from(mm, pos)[0].rstrip(b"\0").decode(errors="replace")] = pos + 32
+            if SEQ.unpack_from(mm, SEQ_POS)[0] == seq:
+                if self.mm is not None:
+                    self.mm.close()
+                self.mm = mm
+                self.slots = slots
+                self.generation = generation
+                return True
+        mm.close()
+        return False
+
+    # retries of a reader: spinning first, then sleeping with doubled times
+    def _waits(self):
+        for i in range(SPINS):
+            yield i
+        deadline = time.monotonic() + TIMEOUT
+        sleep = BACKOFF
+        while time.monotonic() < deadline:
+            time.sleep(sleep)
+            sleep = min(sleep * 2, 0.01)
+            yield sleep
+        raise TimeoutError(f"{self.path}: the writer doesn't finish its update")
+
+    # value of a slot as (number, text), None if it is torn
+    def _slot(self, data, pos):
+        value = data[pos:pos + 28]
+        if zlib.crc32(value[:24]) != CRC.unpack_from(value, 24)[0]:
+            return None
+        number, text = VALUE.unpack_from(value)
+        return number, text.rstrip(b"\0").decode(errors="replace")
+
+    # consistent copy of all values as {key: (number, text)}
+    def read(self):
+        for wait in self._waits():
+            mm = self.mm
+            seq = SEQ.unpack_from(mm, SEQ_POS)[0]
+            data = mm[:]
+            if seq & 1 or SEQ.unpack_from(mm, SEQ_POS)[0] != seq:
+                continue
+            if HEADER.unpack_from(data, 0)[4] != self.generation:
+                self._map() # new layout of a restarted writer
+                continue
+            result = {}
+            for key, pos in self.slots.items():
+                value = self._slot(data, pos)
+                if value is None:
+                    break
+                result[key] = value
+            else:
+                return result
+
+    # value of one key as number (NaN if not numeric)
+    def number(self, key):
+        for wait in self._waits():
+            mm = self.mm
+            if HEADER.unpack_from(mm, 0)[4] != self.generation:
+                self._map() # new layout of a restarted writer
+                continue
+            value = self._slot(mm, self.slots[key])
+            if value is not None:
+                return value[0]
+
+    def close(self):
+        self.mm.close()
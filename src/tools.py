@@ -1,4 +1,5 @@
 #from machine import Pin
+import checksum
 
 # this routine isn't nessecary - see bytes.hex(" ")
 # def format_bytes(bytestring):
@@ -7,14 +8,8 @@
 
 def calculate_checksum(bytestring):
     # The checksum contains the inverted eight bit sum with carry over all data bytes or all data bytes and the protected identifier.
-    cs = 0
-    for b in bytestring:
-        cs = (cs + b) % 0xFF
-
-    cs = ~cs & 0xFF
-    if cs == 0xFF:
-        cs = 0
-    return cs
+    # see checksum.py - the bytestring can be a memoryview slice
+    return checksum.classic(bytestring)
 
 PIN_MAPS = {
     # dc: in=true, pin-no, inverted=true